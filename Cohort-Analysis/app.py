@@ -3,9 +3,13 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import hashlib
+import io
 from groq import Groq
 from dotenv import load_dotenv
-from operator import attrgetter
+from commentary import ResponseCache, stream_commentary
+from summary import DEFAULT_TOKEN_BUDGET, cohort_digest
+from cohorts import DISTINCT_BACKENDS, CohortState, HyperLogLogDistinct, assign_cohorts, month_ordinals, retention_rates, to_periods
 
 # Load API key securely
 load_dotenv()
@@ -15,37 +19,147 @@ if not GROQ_API_KEY:
     st.error("🚨 API Key is missing! Set it in Streamlit Secrets or a .env file.")
     st.stop()
 
-# Streamlit App UI
-st.title("🤖 FP&A AI Agent - SaaS Cohort Analysis")
-st.write("Upload an Excel file, analyze retention rates, and get AI-generated FP&A insights!")
+MODEL = "llama3-8b-8192"
+SYSTEM_PROMPT = "You are an AI-powered FP&A analyst providing financial insights."
+
+
+@st.cache_resource
+def get_groq_client():
+    return Groq(api_key=GROQ_API_KEY)
+
 
-# File uploader
-uploaded_file = st.file_uploader("📂 Upload your cohort data (Excel format)", type=["xlsx"])
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
 
-if uploaded_file:
-    # Read the Excel file
-    sales_data = pd.read_excel(uploaded_file)
+
+@st.cache_resource(show_spinner="Reading transactions...", max_entries=2)
+def load_sales_data(file_hash, _uploaded_file):
+    """Read and prepare the transactions once per distinct upload."""
+    sales_data = pd.read_excel(_uploaded_file)
 
     # Convert Date column to datetime
     sales_data['Date'] = pd.to_datetime(sales_data['Date'])
+    sales_data = sales_data.dropna(subset=['Customer_ID', 'Date']).reset_index(drop=True)
+
+    # Cohort month and months since first purchase, as integer month ordinals
+    codes, cohort, index = assign_cohorts(sales_data['Customer_ID'], sales_data['Date'])
+    sales_data['CohortMonth'] = to_periods(cohort)
+    sales_data['PurchaseMonth'] = to_periods(cohort + index)
+    sales_data['CohortIndex'] = index
+    return sales_data
+
+
+@st.cache_resource(show_spinner="Building cohort matrix...", max_entries=8)
+def build_cohort_state(file_hash, backend_name, precision, _sales_data):
+    """Cohort state for a full-history upload, reused across reruns and AI questions."""
+    backend_class = DISTINCT_BACKENDS[backend_name]
+    backend = backend_class(precision) if backend_class is HyperLogLogDistinct else backend_class()
+    state = CohortState(backend)
+    state.append(_sales_data['Customer_ID'], _sales_data['Date'], batch_id=file_hash)
+    return state
+
 
-    # Extract the first purchase month for each customer
-    sales_data['CohortMonth'] = sales_data.groupby('Customer_ID')['Date'].transform('min').dt.to_period('M')
+@st.cache_resource(show_spinner="Loading saved cohort state...", max_entries=2)
+def load_cohort_state(file_hash, _state_file):
+    return CohortState.load(_state_file)
 
-    # Calculate month difference between the purchase date and the cohort month
-    sales_data['PurchaseMonth'] = sales_data['Date'].dt.to_period('M')
-    sales_data['CohortIndex'] = (sales_data['PurchaseMonth'] - sales_data['CohortMonth']).apply(attrgetter('n'))
 
-    # Create a pivot table for cohort analysis
-    cohort_counts = sales_data.pivot_table(index='CohortMonth', columns='CohortIndex', values='Customer_ID', aggfunc='nunique')
+@st.cache_data(show_spinner=False, max_entries=4)
+def cohort_state_bytes(batches, precision, _cohort_state):
+    """Serialized state for the download button, rebuilt only when new batches are applied."""
+    buffer = io.BytesIO()
+    _cohort_state.save(buffer)
+    return buffer.getvalue()
+
+
+# Streamlit App UI
+st.title("🤖 FP&A AI Agent - SaaS Cohort Analysis")
+st.write("Upload an Excel file, analyze retention rates, and get AI-generated FP&A insights!")
+
+mode = st.radio(
+    "📅 Mode",
+    ["Full history", "Append new month"],
+    horizontal=True,
+    help="Append mode updates a saved cohort state with a file containing only the new transactions.",
+)
+
+preview = None
+cohort_state = None
+
+if mode == "Full history":
+    # File uploader
+    uploaded_file = st.file_uploader("📂 Upload your cohort data (Excel format)", type=["xlsx"])
+
+    if uploaded_file:
+        # Read the Excel file (cached by content hash, so widget changes don't re-read it)
+        file_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        sales_data = load_sales_data(file_hash, uploaded_file)
+        preview = sales_data.head()
+
+        # Distinct-count backend: exact, or HyperLogLog sketches for very large customer bases
+        backend_name = st.radio("🧮 Distinct-count backend", list(DISTINCT_BACKENDS), horizontal=True)
+        precision = None
+        if DISTINCT_BACKENDS[backend_name] is HyperLogLogDistinct:
+            precision = st.slider("HyperLogLog precision (bits)", 8, 16, 12)
+            error = HyperLogLogDistinct(precision).relative_error
+            st.caption(f"Each cell is an estimate with a relative standard error of ±{error:.1%} (about ±{2 * error:.1%} at 95% confidence).")
+
+        cohort_state = build_cohort_state(file_hash, backend_name, precision, sales_data)
+        # Appending later works on a private copy; the cached state stays untouched.
+        st.session_state["cohort_state"] = cohort_state
+else:
+    state_file = st.file_uploader(
+        "💾 Saved cohort state (.npz) - optional if you analyzed the full history earlier in this session",
+        type=["npz"],
+    )
+    new_file = st.file_uploader("📂 New transactions only (Excel format)", type=["xlsx"])
+
+    if state_file:
+        state_hash = hashlib.sha256(state_file.getvalue()).hexdigest()
+        if st.session_state.get("cohort_state_source") != state_hash:
+            st.session_state["cohort_state"] = load_cohort_state(state_hash, state_file).copy()
+            st.session_state["cohort_state_source"] = state_hash
+    cohort_state = st.session_state.get("cohort_state")
+
+    if cohort_state is None:
+        st.info("Upload a saved cohort state, or analyze the full history first.")
+    elif new_file:
+        file_hash = hashlib.sha256(new_file.getvalue()).hexdigest()
+        sales_data = load_sales_data(file_hash, new_file)
+        if file_hash not in cohort_state.batches:
+            cohort_state = cohort_state.copy()
+            cohort_state.append(sales_data['Customer_ID'], sales_data['Date'], batch_id=file_hash)
+            st.session_state["cohort_state"] = cohort_state
+            st.success(f"Appended {len(sales_data):,} transactions to the cohort state.")
+        else:
+            st.caption("This file has already been applied to the cohort state.")
+
+        # The file alone doesn't know earlier purchases; cohorts come from the state
+        preview = sales_data.head().copy()
+        cohort = cohort_state.first_months(preview['Customer_ID'])
+        preview['CohortMonth'] = to_periods(cohort)
+        preview['CohortIndex'] = month_ordinals(preview['Date']) - cohort
+
+    if cohort_state is not None and cohort_state.approximate:
+        st.caption(f"HyperLogLog state: relative standard error ±{cohort_state.backend.relative_error:.1%} per cell.")
+        if cohort_state.restated:
+            st.warning(
+                f"{cohort_state.restated:,} customers had purchases older than their recorded first month; "
+                "their earlier sketch entries stay in the original cohort."
+            )
+
+if cohort_state is not None:
+    # Cohort matrix of unique customers per (cohort month, months since first purchase)
+    cohort_counts = cohort_state.matrix()
 
     # Calculate retention rates
-    cohort_sizes = cohort_counts.iloc[:, 0]
-    retention_rate = cohort_counts.divide(cohort_sizes, axis=0)
+    retention_rate = retention_rates(cohort_counts)
 
     # Display data preview
-    st.subheader("📊 Data Preview")
-    st.dataframe(sales_data.head())
+    if preview is not None:
+        st.subheader("📊 Data Preview")
+        st.dataframe(preview)
 
     # Plot retention rate heatmap
     st.subheader("🔥 Retention Rate Heatmap")
@@ -57,32 +171,33 @@ if uploaded_file:
     plt.tight_layout()
     st.pyplot(plt)
 
-    # Prepare cohort summary for AI
-    cohort_summary = f"""
-    📌 **Cohort Analysis Summary**:
-    - Number of Cohorts: {len(cohort_counts)}
-    - Retention Rate Breakdown:
-    {retention_rate.to_string()}
-    """
+    # Save the cohort state so next month only the new transactions need uploading
+    state_precision = cohort_state.backend.precision if cohort_state.approximate else None
+    st.download_button(
+        "💾 Download cohort state",
+        cohort_state_bytes(tuple(cohort_state.batches), state_precision, cohort_state),
+        file_name="cohort_state.npz",
+        help="Upload this in append mode together with next month's transactions.",
+    )
 
     # AI Agent Section
     st.subheader("🤖 AI Agent - FP&A Commentary")
 
+    # Prepare a compact cohort summary for AI (the full matrix can overflow the model's context)
+    token_budget = st.slider("🧾 Summary token budget", 256, 4096, DEFAULT_TOKEN_BUDGET, step=128)
+    cohort_summary, summary_tokens = cohort_digest(cohort_counts, retention_rate, token_budget)
+    st.caption(f"Cohort summary: ~{summary_tokens:,} tokens (budget {token_budget:,}).")
+    with st.expander("Summary sent to the AI"):
+        st.text(cohort_summary)
+
     # User Prompt Input
     user_prompt = st.text_area("📝 Enter your question for the AI:", "Analyze the cohort retention data and provide key FP&A insights.")
 
     if st.button("🚀 Generate AI Commentary"):
-        client = Groq(api_key=GROQ_API_KEY)
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are an AI-powered FP&A analyst providing financial insights."},
-                {"role": "user", "content": f"The cohort retention analysis is summarized below:\n{cohort_summary}\n{user_prompt}"}
-            ],
-            model="llama3-8b-8192",
-        )
-
-        ai_commentary = response.choices[0].message.content
-
-        # Display AI commentary
+        # Display AI commentary as it streams in (repeated questions come from the cache)
         st.subheader("💡 AI-Generated FP&A Insights")
-        st.write(ai_commentary)
+        st.write_stream(
+            stream_commentary(
+                get_groq_client(), get_response_cache(), MODEL, SYSTEM_PROMPT, cohort_summary, user_prompt
+            )
+        )
@@ -0,0 +1,301 @@
+"""
+Vectorized cohort computations for the SaaS Cohort Analysis app.
+
+Months are handled as integer ordinals (year * 12 + month, counted from
+1970-01 like pandas' monthly Periods), so cohort indices are plain integer
+subtraction on NumPy arrays instead of per-row Period arithmetic.
+"""
+import numpy as np
+import pandas as pd
+
+
+def month_ordinals(dates):
+    """Return months since 1970-01 for an array of datetimes."""
+    values = np.asarray(dates, dtype="datetime64[ns]").astype("datetime64[M]")
+    return values.astype(np.int64)
+
+
+def to_periods(ordinals):
+    """Convert month ordinals back to a monthly PeriodIndex for display."""
+    return pd.PeriodIndex.from_ordinals(np.asarray(ordinals, dtype=np.int64), freq="M")
+
+
+def assign_cohorts(customer_ids, dates):
+    """
+    Assign every transaction to its customer's cohort.
+
+    Returns (customer codes, cohort month ordinals, cohort index), one entry
+    per transaction. Customer codes are dense integers from `pd.factorize`.
+    """
+    codes, _ = pd.factorize(customer_ids)
+    months = month_ordinals(dates)
+    first_month = pd.Series(months).groupby(codes).min().to_numpy()
+    cohort = first_month[codes]
+    return codes, cohort, months - cohort
+
+
+def _cell_layout(cohort, index):
+    """Flat cell id per transaction plus the (first cohort, n cohorts, n indices) grid shape."""
+    first_cohort = int(cohort.min())
+    n_cohorts = int(cohort.max()) - first_cohort + 1
+    n_indices = int(index.max()) + 1
+    cells = (cohort - first_cohort) * n_indices + index
+    return cells, (first_cohort, n_cohorts, n_indices)
+
+
+def _to_matrix(cell_counts, shape):
+    """Reshape flat per-cell counts into the cohort matrix, with NaN for empty cells."""
+    first_cohort, n_cohorts, n_indices = shape
+    values = np.asarray(cell_counts, dtype=float).reshape(n_cohorts, n_indices)
+    counts = pd.DataFrame(
+        values,
+        index=to_periods(np.arange(first_cohort, first_cohort + n_cohorts)),
+        columns=pd.RangeIndex(n_indices),
+    )
+    counts = counts.where(counts > 0)
+    counts = counts.dropna(how="all")
+    counts.index.name = "CohortMonth"
+    counts.columns.name = "CohortIndex"
+    return counts
+
+
+class ExactDistinct:
+    """Exact distinct counts: unique (cell, customer) keys via one sort."""
+
+    name = "Exact"
+    relative_error = 0.0
+
+    def count(self, customers, cohort, index):
+        cells, shape = _cell_layout(cohort, index)
+        customers = np.asarray(customers, dtype=np.int64)
+        n_customers = int(customers.max()) + 1
+        keys = np.sort(cells * n_customers + customers)
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+        return _to_matrix(np.bincount(keys // n_customers, minlength=shape[1] * shape[2]), shape)
+
+
+def _mix64(values):
+    """splitmix64 finalizer: spread integer keys over all 64 bits."""
+    x = np.asarray(values).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(x):
+    """Vectorized int.bit_length() for uint64 arrays."""
+    x = x.copy()
+    length = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        length[big] += shift
+        x[big] >>= np.uint64(shift)
+    return length + (x > 0)
+
+
+class HyperLogLogDistinct:
+    """
+    Approximate distinct counts with one HyperLogLog sketch per cell.
+
+    Each cell keeps 2**precision one-byte registers, so memory depends on
+    the number of cells rather than the number of customers. The relative
+    standard error of every cell is 1.04 / sqrt(2**precision).
+    """
+
+    name = "HyperLogLog"
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = 1 << precision
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(self.registers)
+
+    def sketch(self, customers, cells, n_cells):
+        """Return an (n_cells, registers) uint8 array of HyperLogLog registers."""
+        hashes = _mix64(customers)
+        suffix_bits = 64 - self.precision
+        register = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        rank = (suffix_bits - _bit_length(suffix) + 1).astype(np.uint8)
+
+        sketches = np.zeros(n_cells * self.registers, dtype=np.uint8)
+        np.maximum.at(sketches, cells * self.registers + register, rank)
+        return sketches.reshape(n_cells, self.registers)
+
+    def estimate(self, sketches):
+        """Cardinality estimate per sketch row, with the small-range correction."""
+        m = self.registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -sketches.astype(np.int64)), axis=1)
+        zeros = np.count_nonzero(sketches == 0, axis=1)
+        with np.errstate(divide="ignore"):
+            linear = m * np.log(m / np.maximum(zeros, 1))
+        return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+    def count(self, customers, cohort, index):
+        cells, shape = _cell_layout(cohort, index)
+        sketches = self.sketch(customers, cells, shape[1] * shape[2])
+        return _to_matrix(np.rint(self.estimate(sketches)), shape)
+
+
+DISTINCT_BACKENDS = {
+    "Exact": ExactDistinct,
+    "HyperLogLog (approximate)": HyperLogLogDistinct,
+}
+
+
+MONTH_OFFSET = 1 << 15  # keeps month ordinals non-negative inside packed keys
+MONTH_SPAN = 1 << 16
+
+
+class CohortState:
+    """
+    Cohort state that new transactions can be appended to.
+
+    Keeps the first purchase month of every customer and, depending on the
+    backend, either the distinct (customer, purchase month) pairs (exact) or
+    one HyperLogLog sketch per cohort cell (approximate). Appending a new
+    month of transactions only touches that month's rows; the full history
+    never has to be re-read.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or ExactDistinct()
+        self.customers = pd.Index([])
+        self.first_month = np.empty(0, dtype=np.int64)
+        self.pairs = np.empty(0, dtype=np.int64)  # exact: sorted customer * MONTH_SPAN + month
+        self.sketches = None  # approximate: (cohorts, indices, registers) uint8
+        self.origin = 0  # cohort month ordinal of sketches[0]
+        self.batches = []  # content hashes of the files already appended
+        self.restated = 0  # approximate only: customers whose first month moved after being sketched
+        self._matrix = None
+
+    @property
+    def approximate(self):
+        return isinstance(self.backend, HyperLogLogDistinct)
+
+    def append(self, customer_ids, dates, batch_id=None):
+        """Fold a batch of transactions into the state. Returns False if `batch_id` was already applied."""
+        if batch_id is not None and batch_id in self.batches:
+            return False
+        customer_ids = pd.Index(customer_ids)
+        months = month_ordinals(dates)
+
+        codes = self.customers.get_indexer(customer_ids)
+        new = codes < 0
+        if new.any():
+            new_customers = customer_ids[new].unique()
+            self.customers = self.customers.append(new_customers)
+            self.first_month = np.concatenate(
+                [self.first_month, np.full(len(new_customers), np.iinfo(np.int64).max)]
+            )
+            codes[new] = self.customers.get_indexer(customer_ids[new])
+
+        batch_first = pd.Series(months).groupby(codes).min()
+        touched = batch_first.index.to_numpy()
+        previous = self.first_month[touched]
+        self.first_month[touched] = np.minimum(previous, batch_first.to_numpy())
+
+        if self.approximate:
+            moved = (self.first_month[touched] < previous) & (previous != np.iinfo(np.int64).max)
+            self.restated += int(moved.sum())
+            self._add_to_sketches(codes, months)
+        else:
+            keys = codes * MONTH_SPAN + (months + MONTH_OFFSET)
+            keys = np.sort(np.concatenate([self.pairs, keys]))
+            self.pairs = keys[np.r_[True, keys[1:] != keys[:-1]]]
+
+        if batch_id is not None:
+            self.batches.append(batch_id)
+        self._matrix = None
+        return True
+
+    def _add_to_sketches(self, codes, months):
+        cohort = self.first_month[codes]
+        index = months - cohort
+        registers = self.backend.registers
+        if self.sketches is None:
+            self.origin = int(cohort.min())
+            self.sketches = np.zeros((0, 0, registers), dtype=np.uint8)
+
+        # Grow the (cohort, index) grid to cover this batch.
+        pad_before = max(self.origin - int(cohort.min()), 0)
+        pad_after = max(int(cohort.max()) - self.origin - pad_before - self.sketches.shape[0] + 1, 0)
+        pad_index = max(int(index.max()) + 1 - self.sketches.shape[1], 0)
+        if pad_before or pad_after or pad_index:
+            self.sketches = np.pad(self.sketches, ((pad_before, pad_after), (0, pad_index), (0, 0)))
+            self.origin -= pad_before
+
+        n_cohorts, n_indices, _ = self.sketches.shape
+        cells = (cohort - self.origin) * n_indices + index
+        batch = self.backend.sketch(codes, cells, n_cohorts * n_indices)
+        np.maximum(self.sketches, batch.reshape(self.sketches.shape), out=self.sketches)
+
+    def first_months(self, customer_ids):
+        """Cohort month ordinal of each of `customer_ids` (all must already be in the state)."""
+        return self.first_month[self.customers.get_indexer(pd.Index(customer_ids))]
+
+    def matrix(self):
+        """Return the (cohort month x cohort index) matrix of unique customers."""
+        if self._matrix is None:
+            if self.approximate:
+                n_cohorts, n_indices, registers = self.sketches.shape
+                estimates = np.rint(self.backend.estimate(self.sketches.reshape(-1, registers)))
+                self._matrix = _to_matrix(estimates, (self.origin, n_cohorts, n_indices))
+            else:
+                codes = self.pairs // MONTH_SPAN
+                cohort = self.first_month[codes]
+                index = self.pairs % MONTH_SPAN - MONTH_OFFSET - cohort
+                self._matrix = self.backend.count(codes, cohort, index)
+        return self._matrix
+
+    def copy(self):
+        clone = CohortState(self.backend)
+        clone.__dict__.update(self.__dict__)
+        clone.first_month = self.first_month.copy()
+        clone.pairs = self.pairs.copy()
+        clone.sketches = None if self.sketches is None else self.sketches.copy()
+        clone.batches = list(self.batches)
+        return clone
+
+    def save(self, file):
+        """Write the state to `file` as a compressed .npz archive (no pickling)."""
+        customers = self.customers.to_numpy()
+        if customers.dtype == object:
+            customers = customers.astype(str)
+        np.savez_compressed(
+            file,
+            customers=customers,
+            first_month=self.first_month,
+            pairs=self.pairs,
+            sketches=self.sketches if self.sketches is not None else np.zeros((0, 0, 0), dtype=np.uint8),
+            origin=self.origin,
+            precision=self.backend.precision if self.approximate else 0,
+            batches=np.array(self.batches, dtype=str),
+            restated=self.restated,
+        )
+
+    @classmethod
+    def load(cls, file):
+        """Read a state written by `save`."""
+        with np.load(file, allow_pickle=False) as archive:
+            precision = int(archive["precision"])
+            state = cls(HyperLogLogDistinct(precision) if precision else ExactDistinct())
+            customers = archive["customers"]
+            state.customers = pd.Index(customers.astype(object) if customers.dtype.kind == "U" else customers)
+            state.first_month = archive["first_month"]
+            state.pairs = archive["pairs"]
+            state.sketches = archive["sketches"] if precision else None
+            state.origin = int(archive["origin"])
+            state.batches = archive["batches"].tolist()
+            state.restated = int(archive["restated"])
+        return state
+
+
+def retention_rates(cohort_counts):
+    """Divide each cohort row by its size (the month-0 column)."""
+    cohort_sizes = cohort_counts.iloc[:, 0]
+    return cohort_counts.divide(cohort_sizes, axis=0)
@@ -0,0 +1,115 @@
+"""
+Cached, streamed AI commentary for the SaaS Cohort Analysis app.
+
+Responses are stored in a small SQLite cache keyed by (model, system
+prompt, summary hash, user prompt), with a TTL and a size budget, so a
+repeated question returns instantly. New questions are streamed token by
+token from any client exposing the Groq/OpenAI `chat.completions.create`
+interface.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+CACHE_PATH = os.environ.get(
+    "COMMENTARY_CACHE_PATH", os.path.join(tempfile.gettempdir(), "cohort-commentary-cache.sqlite")
+)
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+CACHE_MAX_BYTES = 20 * 1024**2
+
+
+def cache_key(model, system_prompt, summary, user_prompt):
+    """Key a response by everything that determines it."""
+    summary_hash = hashlib.sha256(summary.encode()).hexdigest()
+    payload = json.dumps([model, system_prompt, summary_hash, user_prompt])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL expiry and LRU eviction by total size."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._db.commit()
+
+    def get(self, key):
+        """Return the cached response for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created = row
+            if now - created > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return response
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode()), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall():
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def stream_commentary(client, cache, model, system_prompt, summary, user_prompt):
+    """
+    Yield the commentary text as it arrives, serving repeats from `cache`.
+
+    The complete response is only cached once the stream finishes, so an
+    interrupted request is never stored half-written.
+    """
+    key = cache_key(model, system_prompt, summary, user_prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    stream = client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"The cohort retention analysis is summarized below:\n{summary}\n{user_prompt}"},
+        ],
+        model=model,
+        stream=True,
+    )
+    parts = []
+    for chunk in stream:
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        if text:
+            parts.append(text)
+            yield text
+    cache.put(key, "".join(parts))
@@ -0,0 +1,117 @@
+"""
+Compact cohort digests for the AI commentary prompt.
+
+Instead of the full retention matrix, the prompt gets retention at a few
+key horizons, cohort-size-weighted averages, best/worst cohorts and trend
+slopes, trimmed to fit a token budget.
+"""
+import re
+
+import numpy as np
+
+KEY_HORIZONS = (1, 3, 6, 12, 24)
+DEFAULT_TOKEN_BUDGET = 1024
+
+# Rough stand-in for the Llama 3 tokenizer: words, 1-3 digit groups and
+# single punctuation marks each count as one token.
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+
+def count_tokens(text):
+    """Estimate the number of tokens in `text`."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def _pct(value):
+    return "-" if np.isnan(value) else f"{value:.0%}"
+
+
+def _weighted_curve(retention_rate, cohort_sizes, horizons):
+    """Cohort-size-weighted retention at each horizon, over cohorts old enough to have it."""
+    curve = {}
+    for h in horizons:
+        values = retention_rate[h]
+        reached = values.notna()
+        if reached.any():
+            curve[h] = np.average(values[reached], weights=cohort_sizes[reached])
+    return curve
+
+
+def _trend(values):
+    """Least-squares slope per cohort (in percentage points), or None with fewer than 3 points."""
+    values = values.dropna()
+    if len(values) < 3:
+        return None
+    return np.polyfit(np.arange(len(values)), values.to_numpy() * 100, 1)[0]
+
+
+def cohort_digest(cohort_counts, retention_rate, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Build a plain-text cohort summary that fits in `token_budget` tokens.
+
+    Returns (summary, estimated token count). Per-cohort lines are added
+    from the most recent cohort backwards until the budget is reached.
+    """
+    cohort_sizes = cohort_counts.iloc[:, 0]
+    horizons = [h for h in KEY_HORIZONS if h in retention_rate.columns]
+    curve = _weighted_curve(retention_rate, cohort_sizes, horizons)
+
+    lines = [
+        "Cohort Analysis Summary",
+        f"- Cohorts: {len(cohort_counts)} ({cohort_counts.index[0]} to {cohort_counts.index[-1]})",
+        f"- Customers: {int(cohort_sizes.sum()):,}; cohort size median {int(cohort_sizes.median()):,}, "
+        f"range {int(cohort_sizes.min()):,}-{int(cohort_sizes.max()):,}",
+    ]
+    if curve:
+        lines.append(
+            "- Size-weighted retention: " + ", ".join(f"M{h} {_pct(v)}" for h, v in curve.items())
+        )
+
+    if horizons:
+        # Rank on the longest horizon that at least three cohorts have reached,
+        # ignoring cohorts smaller than the median so tiny ones don't dominate.
+        typical = retention_rate[cohort_sizes >= cohort_sizes.median()]
+        ranked = [h for h in horizons if typical[h].notna().sum() >= 3]
+        if ranked:
+            h = ranked[-1]
+            values = typical[h].dropna()
+            lines.append(
+                f"- Best M{h} cohorts (size >= median): "
+                + ", ".join(f"{c} {_pct(v)}" for c, v in values.nlargest(3).items())
+            )
+            lines.append(
+                f"- Worst M{h} cohorts (size >= median): "
+                + ", ".join(f"{c} {_pct(v)}" for c, v in values.nsmallest(3).items())
+            )
+        slopes = {h: _trend(retention_rate[h]) for h in horizons}
+        slopes = {h: s for h, s in slopes.items() if s is not None}
+        if slopes:
+            lines.append(
+                "- Trend across cohorts: "
+                + ", ".join(f"M{h} {s:+.2f} pp per cohort" for h, s in slopes.items())
+            )
+
+    summary = "\n".join(lines)
+    tokens = count_tokens(summary)
+    if not horizons:
+        return summary, tokens
+
+    header = f"- Retention by cohort ({', '.join(f'M{h}' for h in horizons)}), newest first, '-' = no data:"
+    cohort_lines = []
+    # Leave room for the "older cohorts omitted" note.
+    used = tokens + count_tokens(header) + count_tokens(f"  ({len(retention_rate)} older cohorts omitted)")
+    for cohort in reversed(retention_rate.index):
+        row = retention_rate.loc[cohort, horizons]
+        line = f"  {cohort} (n={int(cohort_sizes[cohort]):,}): " + " ".join(_pct(v) for v in row)
+        cost = count_tokens(line)
+        if used + cost > token_budget:
+            break
+        cohort_lines.append(line)
+        used += cost
+
+    if cohort_lines:
+        omitted = len(retention_rate) - len(cohort_lines)
+        summary = "\n".join([summary, header, *cohort_lines])
+        if omitted:
+            summary += f"\n  ({omitted} older cohorts omitted)"
+    return summary, count_tokens(summary)
@@ -3,45 +3,158 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
+import io
+from correlation import ANNOTATION_LIMIT, CorrelationStats, cluster_order
+from ingestion import (
+    RunningSummary,
+    SnapshotCache,
+    hash_bytes,
+    iter_upload_chunks,
+    read_upload_bytes,
+)
+from rendering import (
+    DEFAULT_POINT_BUDGET,
+    binned_histogram,
+    binned_kde,
+    box_stats,
+    decimate_scatter,
+)
+
+PREVIEW_ROWS = 100
+
+
+@st.cache_resource
+def get_snapshot_cache():
+    """One snapshot cache per server process, shared across reruns and sessions."""
+    return SnapshotCache()
+
+
+@st.cache_resource(max_entries=8)
+def get_correlation_stats(key, columns, _df):
+    """Sufficient statistics for the numeric columns of upload `key`, built once."""
+    return CorrelationStats.from_frame(_df[list(columns)])
+
+
+@st.cache_data(max_entries=32)
+def render_heatmap(key, columns, _stats):
+    """Render the correlation heatmap for a column subset to PNG bytes."""
+    corr = _stats.corr(columns)
+    large = len(columns) > ANNOTATION_LIMIT
+    if large:
+        order = cluster_order(corr)
+        corr = corr.loc[order, order]
+    size = max(6.4, len(columns) * 0.15) if large else 6.4
+    fig, ax = plt.subplots(figsize=(size, size * 0.75))
+    sns.heatmap(corr, annot=not large, cmap="coolwarm", ax=ax)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def stream_upload(data, name):
+    """Read an upload chunk by chunk, rendering the preview and statistics as they arrive."""
+    st.write("### Data Preview")
+    preview_slot = st.empty()
+    st.write("### Summary Statistics")
+    progress_slot = st.empty()
+    stats_slot = st.empty()
+
+    summary = RunningSummary()
+    chunks = []
+    for chunk in iter_upload_chunks(data, name):
+        if not chunks:
+            preview_slot.dataframe(chunk.head(PREVIEW_ROWS))
+        chunks.append(chunk)
+        summary.update(chunk)
+        progress_slot.caption(f"{summary.rows:,} rows read (quantiles are approximate)")
+        stats_slot.write(summary.describe())
+
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    return df, summary.describe()
+
 
 # App Title
 st.title("Excel File Uploader and Advanced Visualizer")
 
 # File uploader
-uploaded_file = st.file_uploader("Upload an Excel file", type=["xlsx"])
+uploaded_file = st.file_uploader("Upload an Excel or CSV file", type=["xlsx", "csv"])
+streaming = st.checkbox(
+    "Streaming mode for large files",
+    help="Show the first rows and running statistics while the rest of the file is still being read.",
+)
 
 if uploaded_file is not None:
-    # Read the Excel file
+    # Read the file (parsed once per distinct upload, then served from cache)
     try:
-        df = pd.read_excel(uploaded_file)
-        
-        # Display Data Preview
-        st.write("### Data Preview")
-        st.dataframe(df)
+        data = uploaded_file.getvalue()
+        cache = get_snapshot_cache()
+        key = hash_bytes(data)
+        df = cache.get(key)
 
-        # Show Summary Statistics
-        st.write("### Summary Statistics")
-        st.write(df.describe())
+        if streaming:
+            summary_key = f"summary-{key}"
+            if df is None or summary_key not in st.session_state:
+                df, st.session_state[summary_key] = stream_upload(data, uploaded_file.name)
+                cache.put(key, df)
+            else:
+                st.write("### Data Preview")
+                st.dataframe(df.head(PREVIEW_ROWS))
+                st.write("### Summary Statistics")
+                st.caption(f"{len(df):,} rows read (quantiles are approximate)")
+                st.write(st.session_state[summary_key])
+        else:
+            if df is None:
+                df = read_upload_bytes(data, uploaded_file.name)
+                cache.put(key, df)
+
+            # Display Data Preview
+            st.write("### Data Preview")
+            st.dataframe(df)
+
+            # Show Summary Statistics
+            st.write("### Summary Statistics")
+            st.write(df.describe())
 
         # Fancy Visualizations
         st.write("### Fancy Visualizations")
 
+        # Rendering options: downsampled charts cap what is sent to the browser
+        downsample = st.checkbox(
+            "Downsample charts",
+            value=len(df) > DEFAULT_POINT_BUDGET,
+            help="Precompute histogram and box statistics and thin the scatter plot to a point budget.",
+        )
+        if downsample:
+            point_budget = st.slider("Point budget", 1_000, 200_000, DEFAULT_POINT_BUDGET, step=1_000)
+            scatter_method = st.radio("Scatter decimation", ["density", "reservoir"], horizontal=True)
+
         # Dropdowns for selecting columns
         numeric_columns = df.select_dtypes(include=['float64', 'int64']).columns.tolist()
         
         if numeric_columns:
             # Correlation Heatmap
             st.write("#### Correlation Heatmap")
-            fig, ax = plt.subplots()
-            sns.heatmap(df[numeric_columns].corr(), annot=True, cmap="coolwarm", ax=ax)
-            st.pyplot(fig)
+            corr_stats = get_correlation_stats(key, tuple(numeric_columns), df)
+            heatmap_columns = st.multiselect("Columns for the heatmap", numeric_columns, default=numeric_columns)
+            if heatmap_columns:
+                if len(heatmap_columns) > ANNOTATION_LIMIT:
+                    st.caption("Large matrix: columns are ordered by hierarchical clustering and cells are not annotated.")
+                st.image(render_heatmap(key, tuple(heatmap_columns), corr_stats))
 
             # Boxplot
             st.write("#### Boxplot")
             box_col = st.selectbox("Select a column for Boxplot", numeric_columns)
             if box_col:
                 fig, ax = plt.subplots()
-                sns.boxplot(y=df[box_col], ax=ax)
+                if downsample:
+                    stats, dropped = box_stats(df[box_col], label=box_col)
+                    if stats is not None:
+                        ax.bxp([stats], showfliers=True)
+                    if dropped:
+                        st.caption(f"{dropped:,} outliers not drawn")
+                else:
+                    sns.boxplot(y=df[box_col], ax=ax)
                 ax.set_title(f"Boxplot for {box_col}")
                 st.pyplot(fig)
 
@@ -50,7 +163,15 @@ if uploaded_file is not None:
             hist_col = st.selectbox("Select a column for Histogram", numeric_columns)
             if hist_col:
                 fig, ax = plt.subplots()
-                sns.histplot(df[hist_col], bins=20, kde=True, ax=ax)
+                if downsample:
+                    counts, edges = binned_histogram(df[hist_col], bins=20)
+                    ax.stairs(counts, edges, fill=True, alpha=0.6)
+                    grid, curve = binned_kde(df[hist_col], bin_width=edges[1] - edges[0])
+                    ax.plot(grid, curve)
+                    ax.set_xlabel(hist_col)
+                    ax.set_ylabel("Count")
+                else:
+                    sns.histplot(df[hist_col], bins=20, kde=True, ax=ax)
                 ax.set_title(f"Histogram for {hist_col}")
                 st.pyplot(fig)
 
@@ -59,7 +180,15 @@ if uploaded_file is not None:
             scatter_x = st.selectbox("X-axis", numeric_columns, index=0)
             scatter_y = st.selectbox("Y-axis", numeric_columns, index=1 if len(numeric_columns) > 1 else 0)
             if scatter_x and scatter_y:
-                fig = px.scatter(df, x=scatter_x, y=scatter_y, title=f"{scatter_x} vs {scatter_y}")
+                scatter_df = df
+                if downsample:
+                    keep, dropped = decimate_scatter(
+                        df[scatter_x].to_numpy(), df[scatter_y].to_numpy(),
+                        budget=point_budget, method=scatter_method,
+                    )
+                    scatter_df = df.iloc[keep]
+                    st.caption(f"Showing {len(keep):,} of {len(df):,} points ({dropped:,} dropped)")
+                fig = px.scatter(scatter_df, x=scatter_x, y=scatter_y, title=f"{scatter_x} vs {scatter_y}")
                 st.plotly_chart(fig)
 
         else:
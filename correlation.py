@@ -0,0 +1,94 @@
+"""
+Incremental Pearson correlation for the Excel File Uploader app.
+
+Sufficient statistics (pairwise counts, sums, sums of squares and
+cross-products) are accumulated with a few matrix products, so any column
+subset can be answered without rescanning the data and appended rows only
+cost a pass over the new rows.
+"""
+import numpy as np
+import pandas as pd
+
+ANNOTATION_LIMIT = 50  # above this many columns the heatmap is clustered and unannotated
+
+
+class CorrelationStats:
+    """
+    Pairwise-complete sufficient statistics for a set of numeric columns.
+
+    Missing values are handled like `DataFrame.corr()`: each pair uses the
+    rows where both columns are present. Values are shifted by the first
+    batch's column means to keep the raw sums numerically stable.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._position = {c: i for i, c in enumerate(self.columns)}
+        k = len(self.columns)
+        self.rows = 0
+        self._shift = None
+        self._n = np.zeros((k, k))
+        self._sx = np.zeros((k, k))
+        self._sxx = np.zeros((k, k))
+        self._sxy = np.zeros((k, k))
+
+    @classmethod
+    def from_frame(cls, df):
+        stats = cls(df.columns)
+        stats.update(df)
+        return stats
+
+    def update(self, df):
+        """Fold newly appended rows into the statistics."""
+        values = df[self.columns].to_numpy(dtype=float)
+        if not len(values):
+            return
+        present = ~np.isnan(values)
+        if self._shift is None:
+            with np.errstate(invalid="ignore"):
+                self._shift = np.nan_to_num(np.nanmean(values, axis=0))
+        centered = np.where(present, values - self._shift, 0.0)
+        mask = present.astype(float)
+
+        # entry [i, j] only sees rows where both column i and column j are present
+        self._n += mask.T @ mask
+        self._sx += centered.T @ mask
+        self._sxx += (centered * centered).T @ mask
+        self._sxy += centered.T @ centered
+        self.rows += len(values)
+
+    def corr(self, columns=None):
+        """Return the correlation matrix for `columns` (all columns by default)."""
+        columns = self.columns if columns is None else list(columns)
+        idx = np.array([self._position[c] for c in columns], dtype=int)
+        grid = np.ix_(idx, idx)
+        n = self._n[grid]
+        sx = self._sx[grid]
+        sxx = self._sxx[grid]
+        sxy = self._sxy[grid]
+        sy = sx.T
+        syy = sxx.T
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = n * sxy - sx * sy
+            var_x = n * sxx - sx**2
+            var_y = n * syy - sy**2
+            r = cov / np.sqrt(var_x * var_y)
+        r[(n < 2) | (var_x <= 0) | (var_y <= 0)] = np.nan
+        r = np.clip(r, -1.0, 1.0)
+        np.fill_diagonal(r, np.where(np.diag(var_x) > 0, 1.0, np.nan))
+        return pd.DataFrame(r, index=columns, columns=columns)
+
+
+def cluster_order(corr):
+    """Return the columns of `corr` in hierarchical-clustering leaf order."""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+
+    if len(corr) < 3:
+        return list(corr.columns)
+    distance = 1.0 - np.abs(np.nan_to_num(corr.to_numpy()))
+    np.fill_diagonal(distance, 0.0)
+    distance = (distance + distance.T) / 2
+    order = leaves_list(linkage(squareform(distance, checks=False), method="average"))
+    return [corr.columns[i] for i in order]
@@ -2,12 +2,12 @@
 In an environment with streamlit, plotly and duckdb installed,
 Run with `streamlit run streamlit_app.py`
 """
-import random
-import duckdb
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
+from ingestion import UPLOAD_TYPES, parquet_snapshot
+from kpis import KPIS, kpi_snapshot
+from warehouse import Warehouse
 
 #######################################
 # PAGE SETUP
@@ -20,7 +20,7 @@ st.markdown("_Prototype v0.4.1_")
 
 with st.sidebar:
     st.header("Configuration")
-    uploaded_file = st.file_uploader("Choose a file")
+    uploaded_file = st.file_uploader("Choose a file", type=UPLOAD_TYPES)
 
 if uploaded_file is None:
     st.info(" Upload a file through config", icon="ℹ️")
@@ -31,18 +31,41 @@ if uploaded_file is None:
 #######################################
 
 
-@st.cache_data
-def load_data(path: str):
-    df = pd.read_excel(path)
-    return df
+@st.cache_resource(max_entries=8)
+def get_warehouse(file_id: str, _uploaded_file):
+    # Converted to Parquet once per file content; DuckDB queries the Parquet files directly
+    data_hash, path = parquet_snapshot(_uploaded_file.getvalue(), _uploaded_file.name)
+    return data_hash, Warehouse(path)
 
 
-df = load_data(uploaded_file)
-all_months = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
+@st.cache_data(max_entries=256, show_spinner=False)
+def run_query(data_hash: str, query_id: str, params: tuple, _warehouse):
+    # Results are cached per (data, query, parameters); the SQL text never changes
+    return _warehouse.run(query_id, **dict(params))
+
+
+def query(query_id, **params):
+    return run_query(data_hash, query_id, tuple(sorted(params.items())), warehouse)
+
+
+def default_index(options, preferred):
+    return options.index(preferred) if preferred in options else len(options) - 1
+
+
+data_hash, warehouse = get_warehouse(uploaded_file.file_id, uploaded_file)
+
+with st.sidebar:
+    st.header("Filters")
+    years = [int(year) for year in query("years")["Year"]]
+    year = st.selectbox("Year", years, index=default_index(years, 2023))
+    business_units = query("business_units")["business_unit"].tolist()
+    business_unit = st.selectbox("Business Unit", business_units, index=default_index(business_units, "Software"))
+    scenarios = query("scenarios")["Scenario"].tolist()
+    scenario = st.selectbox("Scenario", scenarios, index=default_index(scenarios, "Actuals"))
 
 with st.expander("Data Preview"):
     st.dataframe(
-        df,
+        query("preview"),
         column_config={"Year": st.column_config.NumberColumn(format="%d")},
     )
 
@@ -51,7 +74,7 @@ with st.expander("Data Preview"):
 #######################################
 
 
-def plot_metric(label, value, prefix="", suffix="", show_graph=False, color_graph=""):
+def plot_metric(label, value, prefix="", suffix="", history=None, color_graph=""):
     fig = go.Figure()
 
     fig.add_trace(
@@ -70,10 +93,10 @@ def plot_metric(label, value, prefix="", suffix="", show_graph=False, color_grap
         )
     )
 
-    if show_graph:
+    if history:
         fig.add_trace(
             go.Scatter(
-                y=random.sample(range(0, 101), 30),
+                y=history,
                 hoverinfo="skip",
                 fill="tozeroy",
                 fillcolor=color_graph,
@@ -126,37 +149,27 @@ def plot_gauge(
     st.plotly_chart(fig, use_container_width=True)
 
 
+def plot_kpi(kpi_id, color_graph=""):
+    value, history, _ = kpis[kpi_id]
+    kpi = KPIS[kpi_id]
+    plot_metric(
+        kpi["label"],
+        value,
+        prefix=kpi.get("prefix", ""),
+        suffix=kpi.get("suffix", ""),
+        history=history if color_graph else None,
+        color_graph=color_graph,
+    )
+
+
+def plot_kpi_gauge(kpi_id, indicator_color, max_bound):
+    value = kpis[kpi_id][0]
+    kpi = KPIS[kpi_id]
+    plot_gauge(value, indicator_color, kpi.get("suffix", ""), kpi["label"], max(max_bound, value or 0))
+
+
 def plot_top_right():
-    sales_data = duckdb.sql(
-        f"""
-        WITH sales_data AS (
-            UNPIVOT ( 
-                SELECT 
-                    Scenario,
-                    business_unit,
-                    {','.join(all_months)} 
-                    FROM df 
-                    WHERE Year='2023' 
-                    AND Account='Sales' 
-                ) 
-            ON {','.join(all_months)}
-            INTO
-                NAME month
-                VALUE sales
-        ),
-
-        aggregated_sales AS (
-            SELECT
-                Scenario,
-                business_unit,
-                SUM(sales) AS sales
-            FROM sales_data
-            GROUP BY Scenario, business_unit
-        )
-        
-        SELECT * FROM aggregated_sales
-        """
-    ).df()
+    sales_data = query("sales_by_business_unit", year=year)
 
     fig = px.bar(
         sales_data,
@@ -165,7 +178,7 @@ def plot_top_right():
         color="Scenario",
         barmode="group",
         text_auto=".2s",
-        title="Sales for Year 2023",
+        title=f"Sales for Year {year}",
         height=400,
     )
     fig.update_traces(
@@ -175,24 +188,7 @@ def plot_top_right():
 
 
 def plot_bottom_left():
-    sales_data = duckdb.sql(
-        f"""
-        WITH sales_data AS (
-            SELECT 
-            Scenario,{','.join(all_months)} 
-            FROM df 
-            WHERE Year='2023' 
-            AND Account='Sales'
-            AND business_unit='Software'
-        )
-
-        UNPIVOT sales_data 
-        ON {','.join(all_months)}
-        INTO
-            NAME month
-            VALUE sales
-    """
-    ).df()
+    sales_data = query("monthly_sales", year=year, business_unit=business_unit)
 
     fig = px.line(
         sales_data,
@@ -201,48 +197,21 @@ def plot_bottom_left():
         color="Scenario",
         markers=True,
         text="sales",
-        title="Monthly Budget vs Forecast 2023",
+        title=f"Monthly {business_unit} Sales by Scenario {year}",
     )
     fig.update_traces(textposition="top center")
     st.plotly_chart(fig, use_container_width=True)
 
 
 def plot_bottom_right():
-    sales_data = duckdb.sql(
-        f"""
-        WITH sales_data AS (
-            UNPIVOT ( 
-                SELECT 
-                    Account,Year,{','.join([f'ABS({month}) AS {month}' for month in all_months])}
-                    FROM df 
-                    WHERE Scenario='Actuals'
-                    AND Account!='Sales'
-                ) 
-            ON {','.join(all_months)}
-            INTO
-                NAME year
-                VALUE sales
-        ),
-
-        aggregated_sales AS (
-            SELECT
-                Account,
-                Year,
-                SUM(sales) AS sales
-            FROM sales_data
-            GROUP BY Account, Year
-        )
-        
-        SELECT * FROM aggregated_sales
-    """
-    ).df()
+    sales_data = query("yearly_sales_by_account", scenario=scenario)
 
     fig = px.bar(
         sales_data,
         x="Year",
         y="sales",
         color="Account",
-        title="Actual Yearly Sales Per Account",
+        title=f"{scenario} Yearly Sales Per Account",
     )
     st.plotly_chart(fig, use_container_width=True)
 
@@ -251,6 +220,9 @@ def plot_bottom_right():
 # STREAMLIT LAYOUT
 #######################################
 
+# All tiles come from one grouped query over the selected scenario, cached with the other queries
+kpis = kpi_snapshot(query("kpi_history", scenario=scenario), year)
+
 top_left_column, top_right_column = st.columns((2, 1))
 bottom_left_column, bottom_right_column = st.columns(2)
 
@@ -258,34 +230,20 @@ with top_left_column:
     column_1, column_2, column_3, column_4 = st.columns(4)
 
     with column_1:
-        plot_metric(
-            "Total Accounts Receivable",
-            6621280,
-            prefix="$",
-            suffix="",
-            show_graph=True,
-            color_graph="rgba(0, 104, 201, 0.2)",
-        )
-        plot_gauge(1.86, "#0068C9", "%", "Current Ratio", 3)
+        plot_kpi("accounts_receivable", color_graph="rgba(0, 104, 201, 0.2)")
+        plot_kpi_gauge("current_ratio", "#0068C9", 3)
 
     with column_2:
-        plot_metric(
-            "Total Accounts Payable",
-            1630270,
-            prefix="$",
-            suffix="",
-            show_graph=True,
-            color_graph="rgba(255, 43, 43, 0.2)",
-        )
-        plot_gauge(10, "#FF8700", " days", "In Stock", 31)
+        plot_kpi("accounts_payable", color_graph="rgba(255, 43, 43, 0.2)")
+        plot_kpi_gauge("days_in_stock", "#FF8700", 31)
 
     with column_3:
-        plot_metric("Equity Ratio", 75.38, prefix="", suffix=" %", show_graph=False)
-        plot_gauge(7, "#FF2B2B", " days", "Out Stock", 31)
-        
+        plot_kpi("equity_ratio")
+        plot_kpi_gauge("days_out_of_stock", "#FF2B2B", 31)
+
     with column_4:
-        plot_metric("Debt Equity", 1.10, prefix="", suffix=" %", show_graph=False)
-        plot_gauge(28, "#29B09D", " days", "Delay", 31)
+        plot_kpi("debt_equity")
+        plot_kpi_gauge("delay_days", "#29B09D", 31)
 
 with top_right_column:
     plot_top_right()
@@ -0,0 +1,135 @@
+"""
+Upload ingestion for the Sales Dashboard.
+
+Every upload is converted once into a Parquet file named after a hash of
+its bytes; reruns and repeat uploads of the same file reuse it. CSV files
+are converted by DuckDB without going through pandas, Parquet uploads are
+stored as-is, and Excel workbooks are read once with pandas (a sheet holds
+at most about a million rows). DuckDB then scans the Parquet files
+directly, pushing column selection and filters down into the scan.
+
+Files derived from one upload (`<hash>.parquet`, `<hash>.long.parquet`)
+are evicted together, and never while a warehouse still reads them.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import Counter
+
+import duckdb
+import pandas as pd
+
+CACHE_DIR = os.environ.get(
+    "DASHBOARD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sales-dashboard-parquet")
+)
+MAX_CACHE_BYTES = 20 * 1024**3  # disk budget for converted uploads
+UPLOAD_TYPES = ["xlsx", "xls", "csv", "parquet"]
+
+_in_use = Counter()  # cache key -> number of open warehouses reading its files
+_in_use_lock = threading.Lock()
+
+
+def hash_bytes(data, block_size=8 * 1024**2):
+    """Return a content hash for the uploaded bytes."""
+    digest = hashlib.blake2b(digest_size=16)
+    view = memoryview(data)
+    for start in range(0, len(view), block_size):
+        digest.update(view[start:start + block_size])
+    return digest.hexdigest()
+
+
+def temporary_path(path):
+    """A per-process, per-thread scratch name next to `path` (renamed into place when complete)."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def cache_key(path):
+    """Upload hash that a cached Parquet file (base or derived) belongs to."""
+    return os.path.basename(path).split(".", 1)[0]
+
+
+def hold(path):
+    """Protect the files of `path`'s upload from eviction until `release`."""
+    with _in_use_lock:
+        _in_use[cache_key(path)] += 1
+
+
+def release(path):
+    """Undo one `hold` of `path`'s upload."""
+    with _in_use_lock:
+        _in_use[cache_key(path)] -= 1
+        if _in_use[cache_key(path)] <= 0:
+            del _in_use[cache_key(path)]
+
+
+def sql_string(value):
+    """Quote a string (e.g. a file path) as a SQL literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _write_parquet(data, name, path):
+    """Convert uploaded bytes to a Parquet file at `path`."""
+    tmp_path = temporary_path(path)
+    extension = name.lower().rsplit(".", 1)[-1]
+    try:
+        if extension == "parquet":
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        elif extension == "csv":
+            csv_path = f"{tmp_path}.csv"
+            with open(csv_path, "wb") as f:
+                f.write(data)
+            try:
+                con = duckdb.connect()
+                con.execute(f"COPY (SELECT * FROM read_csv_auto({sql_string(csv_path)})) TO {sql_string(tmp_path)} (FORMAT parquet)")
+                con.close()
+            finally:
+                os.remove(csv_path)
+        else:
+            pd.read_excel(io.BytesIO(data)).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, keep=()):
+    """
+    Delete the least recently used uploads' Parquet files until the disk budget is met.
+
+    All files of one upload go together; uploads in `keep` or held by an
+    open warehouse are never deleted.
+    """
+    groups = {}
+    for name in os.listdir(cache_dir):
+        if name.endswith(".parquet"):
+            path = os.path.join(cache_dir, name)
+            stat = os.stat(path)
+            mtime, size, paths = groups.get(cache_key(name), (0, 0, []))
+            groups[cache_key(name)] = (max(mtime, stat.st_mtime), size + stat.st_size, paths + [path])
+    total = sum(size for _, size, _ in groups.values())
+    with _in_use_lock:
+        protected = set(_in_use) | {cache_key(path) for path in keep}
+    for key, (_, size, paths) in sorted(groups.items(), key=lambda item: item[1][0]):
+        if total <= max_bytes:
+            break
+        if key in protected:
+            continue
+        for path in paths:
+            os.remove(path)
+        total -= size
+
+
+def parquet_snapshot(data, name, cache_dir=CACHE_DIR):
+    """Return (content hash, Parquet path) for an upload, converting it on the first sight only."""
+    os.makedirs(cache_dir, exist_ok=True)
+    key = hash_bytes(data)
+    path = os.path.join(cache_dir, f"{key}.parquet")
+    if os.path.exists(path):
+        os.utime(path)  # mark as recently used
+    else:
+        _write_parquet(data, name, path)
+        evict(cache_dir, keep={path})
+    return key, path
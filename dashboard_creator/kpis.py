@@ -0,0 +1,69 @@
+"""
+KPI definitions for the Sales Dashboard tiles and gauges.
+
+Each KPI is a SQL aggregate over the long fact table, evaluated per
+period (year and month). All KPIs are computed together in a single
+grouped query, which also provides the history for the sparklines. A KPI
+whose accounts are missing from the upload comes out as NULL.
+"""
+
+
+def account_total(account):
+    """SQL for the period total of one account."""
+    return f"SUM(value) FILTER (WHERE Account = '{account}')"
+
+
+def ratio(numerator, denominator, scale=1):
+    """SQL for `scale` * numerator / denominator account totals (NULL when the denominator is zero)."""
+    return f"{scale} * {account_total(numerator)} / NULLIF({account_total(denominator)}, 0)"
+
+
+# id -> definition; `sql` is evaluated per (Year, month) for the selected scenario.
+KPIS = {
+    "accounts_receivable": {"label": "Total Accounts Receivable", "sql": account_total("Accounts Receivable"), "prefix": "$"},
+    "accounts_payable": {"label": "Total Accounts Payable", "sql": account_total("Accounts Payable"), "prefix": "$"},
+    "equity_ratio": {"label": "Equity Ratio", "sql": ratio("Total Equity", "Total Assets", 100), "suffix": " %"},
+    "debt_equity": {"label": "Debt Equity", "sql": ratio("Total Debt", "Total Equity")},
+    "current_ratio": {"label": "Current Ratio", "sql": ratio("Current Assets", "Current Liabilities")},
+    "days_in_stock": {"label": "In Stock", "sql": "AVG(value) FILTER (WHERE Account = 'Days In Stock')", "suffix": " days"},
+    "days_out_of_stock": {"label": "Out Stock", "sql": "AVG(value) FILTER (WHERE Account = 'Days Out Of Stock')", "suffix": " days"},
+    "delay_days": {"label": "Delay", "sql": "AVG(value) FILTER (WHERE Account = 'Delay Days')", "suffix": " days"},
+}
+SPARKLINE_PERIODS = 24
+
+
+def kpi_query():
+    """One grouped query returning every KPI per period for `$scenario`."""
+    columns = ",\n            ".join(f"{kpi['sql']} AS {kpi_id}" for kpi_id, kpi in KPIS.items())
+    return f"""
+        SELECT
+            Year,
+            month_number,
+            month,
+            {columns}
+        FROM financials_long
+        WHERE Scenario = $scenario
+        GROUP BY Year, month_number, month
+        ORDER BY Year, month_number
+    """
+
+
+def kpi_snapshot(history, year, periods=SPARKLINE_PERIODS):
+    """
+    Latest value of each KPI in `year` plus its sparkline history.
+
+    Returns {kpi id: (value or None, history list, period label)}; the
+    history covers up to `periods` periods ending at the latest value.
+    """
+    history = history[history["Year"] <= year]
+    snapshot = {}
+    for kpi_id in KPIS:
+        series = history[["Year", "month", kpi_id]].dropna(subset=[kpi_id])
+        in_year = series[series["Year"] == year]
+        if in_year.empty:
+            snapshot[kpi_id] = (None, [], "")
+            continue
+        latest = in_year.iloc[-1]
+        values = series.loc[:latest.name, kpi_id].iloc[-periods:]
+        snapshot[kpi_id] = (float(latest[kpi_id]), values.tolist(), f"{latest['month']} {int(latest['Year'])}")
+    return snapshot
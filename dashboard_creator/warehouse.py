@@ -0,0 +1,124 @@
+"""
+DuckDB storage for the Sales Dashboard.
+
+Each uploaded file gets one DuckDB connection with two views over Parquet
+files: `financials` (the upload as converted by `ingestion`) and
+`financials_long` (one row per id columns x month), which is materialized
+to Parquet once per file. Every chart queries the long view, so no rerun
+repeats the UNPIVOT, and DuckDB only reads the columns and row groups a
+query needs.
+
+Chart queries are fixed SQL texts in `QUERIES`, addressed by id, with
+values passed as bound parameters ($name) rather than formatted into the
+SQL. Plans are not reused: DuckDB parses and plans every execution (a
+few milliseconds here). Repeated work is avoided by the app's result
+cache, keyed by dataset, query id and parameters.
+"""
+import os
+import weakref
+
+import duckdb
+
+from ingestion import hold, release, sql_string, temporary_path
+from kpis import kpi_query
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+QUERIES = {
+    "preview": "SELECT * FROM financials LIMIT 1000",
+    "years": "SELECT DISTINCT Year FROM financials ORDER BY Year",
+    "scenarios": "SELECT DISTINCT Scenario FROM financials ORDER BY Scenario",
+    "business_units": "SELECT DISTINCT business_unit FROM financials ORDER BY business_unit",
+    "sales_by_business_unit": """
+        SELECT
+            Scenario,
+            business_unit,
+            SUM(value) AS sales
+        FROM financials_long
+        WHERE Year = $year
+        AND Account = 'Sales'
+        GROUP BY Scenario, business_unit
+        ORDER BY Scenario, business_unit
+    """,
+    "monthly_sales": """
+        SELECT
+            Scenario,
+            month,
+            SUM(value) AS sales
+        FROM financials_long
+        WHERE Year = $year
+        AND Account = 'Sales'
+        AND business_unit = $business_unit
+        GROUP BY Scenario, month, month_number
+        ORDER BY Scenario, month_number
+    """,
+    "yearly_sales_by_account": """
+        SELECT
+            Account,
+            Year,
+            SUM(ABS(value)) AS sales
+        FROM financials_long
+        WHERE Scenario = $scenario
+        AND Account != 'Sales'
+        GROUP BY Account, Year
+        ORDER BY Account, Year
+    """,
+    "kpi_history": kpi_query(),
+}
+
+
+def quote(name):
+    """Quote a column name for SQL."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class Warehouse:
+    """A DuckDB connection with `financials` and `financials_long` views over one upload's Parquet files."""
+
+    def __init__(self, path):
+        # The Parquet files stay protected from eviction for as long as this object is alive
+        hold(path)
+        weakref.finalize(self, release, path)
+        self.con = duckdb.connect()
+        self.con.execute(f"CREATE VIEW financials AS SELECT * FROM read_parquet({sql_string(path)})")
+        columns = [row[0] for row in self.con.execute("DESCRIBE financials").fetchall()]
+        self.months = [m for m in MONTHS if m in columns]
+
+        self.long_path = path[: -len(".parquet")] + ".long.parquet"
+        if not os.path.exists(self.long_path):
+            month_list = ", ".join(quote(m) for m in self.months)
+            month_names = ", ".join(f"'{m}'" for m in self.months)
+            tmp_path = temporary_path(self.long_path)
+            self.con.execute(
+                f"""
+                COPY (
+                    SELECT *, list_position([{month_names}], month) AS month_number
+                    FROM (
+                        UNPIVOT financials
+                        ON {month_list}
+                        INTO
+                            NAME month
+                            VALUE value
+                    )
+                ) TO {sql_string(tmp_path)} (FORMAT parquet)
+                """
+            )
+            os.replace(tmp_path, self.long_path)
+        self.con.execute(f"CREATE VIEW financials_long AS SELECT * FROM read_parquet({sql_string(self.long_path)})")
+
+    def run(self, query_id, **params):
+        """Execute the named query from `QUERIES` with bound `params`."""
+        return self.sql(QUERIES[query_id], params or None)
+
+    def sql(self, query, params=None):
+        """
+        Run `query` with bound `params` on a fresh cursor and return a DataFrame.
+
+        A cursor per call keeps the shared warehouse safe across sessions;
+        the statement is planned again on every call.
+        """
+        cursor = self.con.cursor()
+        try:
+            return cursor.execute(query, params).df()
+        finally:
+            cursor.close()
@@ -0,0 +1,223 @@
+"""
+Ingestion helpers for the Excel File Uploader app.
+
+Uploaded workbooks are keyed by a hash of their bytes, parsed once and kept
+as Parquet snapshots on local disk so later reruns never re-parse the file.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.environ.get(
+    "UPLOAD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "streamlit-apps-uploads")
+)
+MAX_SNAPSHOT_BYTES = 2 * 1024**3  # disk budget for Parquet snapshots
+MAX_MEMORY_FRAMES = 4  # parsed DataFrames kept in memory
+
+
+def hash_bytes(data, block_size=8 * 1024**2):
+    """Return a content hash for the uploaded bytes."""
+    digest = hashlib.blake2b(digest_size=16)
+    view = memoryview(data)
+    for start in range(0, len(view), block_size):
+        digest.update(view[start:start + block_size])
+    return digest.hexdigest()
+
+
+class SnapshotCache:
+    """Two-tier (memory, then Parquet on disk) LRU cache of parsed uploads."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_SNAPSHOT_BYTES, max_frames=MAX_MEMORY_FRAMES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def _remember(self, key, df):
+        with self._lock:
+            self._frames[key] = df
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached frame for `key`, or None if it was never stored."""
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key]
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except (OSError, ValueError):
+            # Truncated or unreadable snapshot: drop it and re-parse.
+            os.remove(path)
+            return None
+        os.utime(path)  # mark as recently used
+        self._remember(key, df)
+        return df
+
+    def put(self, key, df):
+        """Store `df` in memory and, if Arrow can encode it, as a Parquet snapshot."""
+        self._remember(key, df)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+        except (ValueError, TypeError, NotImplementedError, ImportError):
+            # Mixed-type object columns can't be written by Arrow; keep the
+            # in-memory copy only.
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used snapshots until the disk budget is met."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".parquet"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+
+def read_excel_bytes(data):
+    """Parse workbook bytes with pandas."""
+    return pd.read_excel(io.BytesIO(data))
+
+
+def read_upload_bytes(data, name):
+    """Parse CSV or Excel bytes in one go, dispatching on the file name."""
+    if name.lower().endswith(".csv"):
+        return pd.read_csv(io.BytesIO(data))
+    return read_excel_bytes(data)
+
+
+# ----------------
+# Streaming reader
+# ----------------
+CHUNK_ROWS = 50_000
+QUANTILE_SAMPLE = 20_000  # values per column kept for approximate quantiles
+
+
+def iter_csv_chunks(data, chunksize=CHUNK_ROWS):
+    """Yield DataFrames of at most `chunksize` rows from CSV bytes."""
+    yield from pd.read_csv(io.BytesIO(data), chunksize=chunksize)
+
+
+def iter_xlsx_chunks(data, chunksize=CHUNK_ROWS):
+    """Yield DataFrames of at most `chunksize` rows from the first sheet, row by row."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [c if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        batch = []
+        for row in rows:
+            batch.append(row[:len(columns)])
+            if len(batch) == chunksize:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_upload_chunks(data, name, chunksize=CHUNK_ROWS):
+    """Yield chunks of a CSV or Excel upload, dispatching on the file name."""
+    if name.lower().endswith(".csv"):
+        return iter_csv_chunks(data, chunksize)
+    return iter_xlsx_chunks(data, chunksize)
+
+
+class RunningSummary:
+    """
+    Summary statistics built incrementally from chunks.
+
+    Count, mean, variance, min and max are merged exactly (Chan et al.);
+    quantiles come from a fixed-size uniform sample per column (bottom-k
+    random keys), so memory stays bounded whatever the file size.
+    """
+
+    def __init__(self, sample_size=QUANTILE_SAMPLE, seed=0):
+        self.sample_size = sample_size
+        self.rows = 0
+        self._rng = np.random.default_rng(seed)
+        self._moments = {}  # column -> [count, mean, m2, min, max]
+        self._samples = {}  # column -> (keys, values)
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        for column in chunk.select_dtypes(include="number").columns:
+            values = chunk[column].to_numpy(dtype=float)
+            values = values[~np.isnan(values)]
+            if not values.size:
+                continue
+            self._merge_moments(column, values)
+            self._merge_sample(column, values)
+
+    def _merge_moments(self, column, values):
+        n_b = values.size
+        mean_b = values.mean()
+        m2_b = np.square(values - mean_b).sum()
+        if column not in self._moments:
+            self._moments[column] = [n_b, mean_b, m2_b, values.min(), values.max()]
+            return
+        n_a, mean_a, m2_a, min_a, max_a = self._moments[column]
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        self._moments[column] = [
+            n,
+            mean_a + delta * n_b / n,
+            m2_a + m2_b + delta**2 * n_a * n_b / n,
+            min(min_a, values.min()),
+            max(max_a, values.max()),
+        ]
+
+    def _merge_sample(self, column, values):
+        keys = self._rng.random(values.size)
+        if column in self._samples:
+            old_keys, old_values = self._samples[column]
+            keys = np.concatenate([old_keys, keys])
+            values = np.concatenate([old_values, values])
+        if keys.size > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            keys, values = keys[keep], values[keep]
+        self._samples[column] = (keys, values)
+
+    def describe(self):
+        """Return a frame laid out like `DataFrame.describe()`."""
+        index = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+        summary = {}
+        for column, (count, mean, m2, low, high) in self._moments.items():
+            std = np.sqrt(m2 / (count - 1)) if count > 1 else np.nan
+            q25, q50, q75 = np.quantile(self._samples[column][1], [0.25, 0.5, 0.75])
+            summary[column] = [count, mean, std, low, q25, q50, q75, high]
+        return pd.DataFrame(summary, index=index)
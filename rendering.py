@@ -0,0 +1,144 @@
+"""
+Downsampled chart data for the Excel File Uploader app.
+
+Histograms, KDE curves and box statistics are precomputed with NumPy, and
+scatter points are decimated to a fixed budget, so the browser only ever
+receives a bounded payload regardless of how many rows were uploaded.
+"""
+import numpy as np
+
+DEFAULT_POINT_BUDGET = 20_000
+KDE_GRID_SIZE = 512
+
+
+def _finite(values):
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+def binned_histogram(values, bins=20):
+    """Return (counts, edges) for the finite values of a column."""
+    return np.histogram(_finite(values), bins=bins)
+
+
+def binned_kde(values, bin_width, grid_size=KDE_GRID_SIZE):
+    """
+    Gaussian KDE evaluated on a fine grid by smoothing a histogram.
+
+    Uses Scott's rule for the bandwidth (as seaborn does) and scales the
+    density to counts per `bin_width`, so it overlays a count histogram.
+    Returns (grid, curve); both are empty when the column is constant.
+    """
+    values = _finite(values)
+    if values.size < 2 or values.std() == 0:
+        return np.array([]), np.array([])
+
+    bandwidth = values.std(ddof=1) * values.size ** (-1 / 5)
+    low, high = values.min() - 3 * bandwidth, values.max() + 3 * bandwidth
+    counts, edges = np.histogram(values, bins=grid_size, range=(low, high))
+    step = edges[1] - edges[0]
+    grid = edges[:-1] + step / 2
+
+    half_width = int(np.ceil(4 * bandwidth / step))
+    offsets = np.arange(-half_width, half_width + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= kernel.sum()
+    smoothed = np.convolve(counts, kernel, mode="same")
+    return grid, smoothed * bin_width / step
+
+
+def box_stats(values, label="", max_fliers=1_000, seed=0):
+    """
+    Box statistics in the format expected by `Axes.bxp`.
+
+    Whiskers follow the usual 1.5 IQR rule; outliers beyond them are
+    sampled down to `max_fliers`. Also returns the number of fliers dropped.
+    """
+    values = _finite(values)
+    if not values.size:
+        return None, 0
+    q1, med, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    fliers = values[(values < inside.min()) | (values > inside.max())]
+    dropped = 0
+    if fliers.size > max_fliers:
+        rng = np.random.default_rng(seed)
+        dropped = fliers.size - max_fliers
+        fliers = rng.choice(fliers, max_fliers, replace=False)
+    stats = {
+        "label": label,
+        "med": med,
+        "q1": q1,
+        "q3": q3,
+        "whislo": inside.min(),
+        "whishi": inside.max(),
+        "fliers": fliers,
+    }
+    return stats, dropped
+
+
+def reservoir_sample(n, budget, seed=0):
+    """Return sorted indices of a uniform sample of `budget` rows out of `n`."""
+    if n <= budget:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n, budget, replace=False))
+
+
+def density_sample(x, y, budget, grid_size=100, seed=0):
+    """
+    Decimate scatter points by 2D density binning.
+
+    Points are bucketed into a `grid_size` x `grid_size` grid and every
+    occupied cell keeps at most the same number of points, so sparse
+    regions and outliers survive while dense clusters are thinned.
+    Returns sorted indices into `x`/`y`.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if valid.size <= budget:
+        return valid
+
+    def bucket(values):
+        low, high = values.min(), values.max()
+        if high == low:
+            return np.zeros(values.size, dtype=np.int64)
+        scaled = (values - low) / (high - low) * grid_size
+        return np.minimum(scaled.astype(np.int64), grid_size - 1)
+
+    cells = bucket(x[valid]) * grid_size + bucket(y[valid])
+    rng = np.random.default_rng(seed)
+    # Shuffle, then stable-sort by cell: points within a cell end up in random order.
+    shuffled = rng.permutation(valid.size)
+    order = shuffled[np.argsort(cells[shuffled], kind="stable")]
+    sorted_cells = cells[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    run_lengths = np.diff(np.r_[starts, sorted_cells.size])
+    rank = np.arange(sorted_cells.size) - np.repeat(starts, run_lengths)
+
+    # Largest per-cell cap that keeps the total within budget.
+    low, high = 1, int(run_lengths.max())
+    while low < high:
+        mid = (low + high + 1) // 2
+        if np.minimum(run_lengths, mid).sum() <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    cap = low
+
+    keep = valid[order[rank < cap]]
+    if keep.size > budget:
+        keep = rng.choice(keep, budget, replace=False)
+    return np.sort(keep)
+
+
+def decimate_scatter(x, y, budget=DEFAULT_POINT_BUDGET, method="density", seed=0):
+    """Return (indices to plot, number of points dropped) for a scatter plot."""
+    n = len(x)
+    if method == "reservoir":
+        keep = reservoir_sample(n, budget, seed)
+    else:
+        keep = density_sample(x, y, budget, seed=seed)
+    return keep, n - keep.size
@@ -1,40 +1,22 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.io as pio
-import base64
-import io
-
-# Ensure Kaleido is recognized for PNG export
-pio.kaleido.scope.default_format = "png"
-pio.kaleido.scope.default_width = 1200
-pio.kaleido.scope.default_height = 700
+import hashlib
+import re
+from graph import FLOW_COLUMNS, NUMBER_FORMATS, flows_frame, parse_flow_lines, sankey_arrays
+from pruning import FlowHierarchy, prune_links
+from colors import PALETTES, SCHEMES, node_colors, parse_color_rules, read_color_map
+from export import IMAGE_FORMATS, ImageExporter
 
 st.set_page_config(page_title="Sankey Diagrams for FP&A", layout="wide")
 
 # ----------------
 # Helper Functions
 # ----------------
-def parse_flow_text(flow_text: str):
-    flows = []
-    lines = flow_text.strip().split("\n")
-    for line in lines:
-        if not line.strip():
-            continue
-        try:
-            parts = line.strip().split("[")
-            source_part = parts[0].strip()
-            remainder = parts[1].split("]")
-            amount_part = remainder[0].strip()
-            target_part = remainder[1].strip()
-
-            source = source_part
-            target = target_part
-            amount = float(amount_part)
-            flows.append((source, amount, target))
-        except:
-            st.warning(f"Could not parse line: {line}")
-    return flows
+@st.cache_data(show_spinner=False, max_entries=32)
+def parse_flow_text(text_hash, number_format, _flow_text):
+    """Parse manual "Source [Amount] Target" lines, cached by the hash of the text."""
+    return parse_flow_lines(_flow_text, number_format)
 
 
 def load_data_from_file(uploaded_file):
@@ -47,13 +29,12 @@ def load_data_from_file(uploaded_file):
     else:
         df = pd.read_excel(uploaded_file)
 
-    required_cols = {"Source", "Amount", "Target"}
+    required_cols = set(FLOW_COLUMNS)
     if not required_cols.issubset(df.columns):
         st.error(f"Uploaded file must contain columns: {required_cols}")
         return []
 
-    flows = [(row["Source"], row["Amount"], row["Target"]) for _, row in df.iterrows()]
-    return flows
+    return flows_frame(df, extra_columns=df.columns)
 
 
 def build_sankey(
@@ -63,25 +44,9 @@ def build_sankey(
     node_padding=20,
     opacity=0.6
 ):
-    labels = []
-    for source, amount, target in flows:
-        if source not in labels:
-            labels.append(source)
-        if target not in labels:
-            labels.append(target)
-
-    label_to_index = {label: i for i, label in enumerate(labels)}
-
-    sources = [label_to_index[s] for s, _, _ in flows]
-    targets = [label_to_index[t] for _, _, t in flows]
-    values = [a for _, a, _ in flows]
-
-    colors = []
-    for label in labels:
-        if node_color_map and label in node_color_map:
-            colors.append(node_color_map[label])
-        else:
-            colors.append("#1f77b4")
+    labels, sources, targets, values = sankey_arrays(flows)
+
+    colors = pd.Series(labels, dtype=object).map(node_color_map or {}).fillna("#1f77b4").to_numpy()
 
     node = dict(
         pad=node_padding,
@@ -95,23 +60,43 @@ def build_sankey(
         source=sources,
         target=targets,
         value=values,
-        color=[f"rgba(153, 204, 255, {opacity})"] * len(values)
+        color=f"rgba(153, 204, 255, {opacity})"
     )
 
     fig = go.Figure(data=[go.Sankey(node=node, link=link, arrangement="snap")])
     return fig
 
 
-def generate_download_link(fig, file_format="png"):
-    buffer = io.BytesIO()
-    fig.write_image(buffer, format=file_format)
-    b64 = base64.b64encode(buffer.getvalue()).decode()
+@st.cache_resource(max_entries=8)
+def get_hierarchy(flows_key, separator, _flows):
+    """Account hierarchy of the current flows, shared across reruns (collapsed and pruned graphs are cached inside)."""
+    return FlowHierarchy(_flows, separator=separator)
+
+
+def style_sankey(fig, title, title_font_family, title_font_size, node_label_font_family, node_label_font_size):
+    fig.update_layout(
+        title=dict(
+            text=title,
+            font=dict(family=title_font_family, size=title_font_size)
+        ),
+        hovermode="x",
+        margin=dict(l=50, r=50, t=50, b=50),
+        width=1200,
+        height=700,
+        font=dict(
+            family=node_label_font_family,
+            size=node_label_font_size,
+            color="black"
+        )
+    )
+    return fig
+
+
+@st.cache_resource
+def get_exporter():
+    """One background image renderer (and image cache) shared by all sessions."""
+    return ImageExporter()
 
-    if file_format == "png":
-        href = f'<a href="data:image/png;base64,{b64}" download="sankey_diagram.png">Download PNG</a>'
-    else:
-        href = f'<a href="data:image/svg+xml;base64,{b64}" download="sankey_diagram.svg">Download SVG</a>'
-    return href
 
 # ---------------
 # Streamlit App
@@ -154,6 +139,7 @@ def main():
         "Or input flows manually in the format:\n\nSource [Amount] Target",
         height=150
     )
+    number_format = st.sidebar.radio("Amount Format", list(NUMBER_FORMATS), horizontal=True)
 
     node_thickness = st.sidebar.slider("Node Thickness", 10, 50, 20)
     node_padding = st.sidebar.slider("Node Padding", 10, 50, 20)
@@ -177,31 +163,67 @@ def main():
     node_label_font_size = st.sidebar.slider("Node Label Font Size", 8, 24, 12)
 
     flows = []
+    flows_hash = hashlib.blake2b(digest_size=16)
     if uploaded_file:
         file_flows = load_data_from_file(uploaded_file)
-        flows.extend(file_flows)
+        if len(file_flows):
+            flows.append(file_flows)
+            flows_hash.update(uploaded_file.getvalue())
 
     if manual_flows_text.strip():
-        text_flows = parse_flow_text(manual_flows_text)
-        flows.extend(text_flows)
+        text_hash = hashlib.blake2b(manual_flows_text.encode(), digest_size=16).hexdigest()
+        text_flows, text_errors = parse_flow_text(text_hash, number_format, manual_flows_text)
+        if len(text_errors):
+            st.warning(f"{len(text_errors):,} of {len(text_flows) + len(text_errors):,} lines could not be parsed.")
+            st.dataframe(text_errors, hide_index=True)
+        if len(text_flows):
+            flows.append(text_flows)
+            flows_hash.update(f"{text_hash}:{number_format}".encode())
 
     if not flows:
         st.info("No flows available. Upload a file or input flows manually.")
         return
+    flows = source_flows = pd.concat(flows, ignore_index=True)
+
+    # Simplify large diagrams: collapse the account hierarchy, then keep the top links per node
+    st.sidebar.header("Simplify Diagram")
+    separator = st.sidebar.text_input("Account Hierarchy Separator", value=":") or ":"
+    hierarchy = get_hierarchy(flows_hash.hexdigest(), separator, flows)
+    depth = hierarchy.max_depth
+    if hierarchy.max_depth > 1:
+        depth = st.sidebar.slider("Hierarchy Depth", 1, hierarchy.max_depth, hierarchy.max_depth)
+    expanded = st.session_state.get("expanded_nodes", [])
+    flows = hierarchy.links(depth, expanded)
+    if hierarchy.max_depth > 1:
+        nodes = pd.unique(flows[["Source", "Target"]].to_numpy().ravel())
+        st.sidebar.multiselect(
+            "Expand Nodes", options=sorted(set(hierarchy.expandable(nodes)) | set(expanded)), key="expanded_nodes"
+        )
+    top_n = st.sidebar.number_input("Top Links per Node (0 = show all)", min_value=0, max_value=100, value=10)
+    flows = hierarchy.pruned(depth, expanded, top_n)
 
-    unique_nodes = set()
-    for s, amt, t in flows:
-        unique_nodes.add(s)
-        unique_nodes.add(t)
-    unique_nodes = sorted(list(unique_nodes))
+    unique_nodes = sorted(pd.unique(flows[["Source", "Target"]].to_numpy().ravel()))
 
     st.sidebar.header("Node Color Customization")
-    st.sidebar.write("Pick a color for each node:")
-    node_color_map = {}
-    for node in unique_nodes:
-        color_default = "#1f77b4"
-        chosen_color = st.sidebar.color_picker(f"{node}", color_default)
-        node_color_map[node] = chosen_color
+    # Colours come from rules; only explicitly overridden nodes get their own picker
+    scheme = st.sidebar.selectbox("Colour Scheme", SCHEMES)
+    palette = st.sidebar.selectbox("Palette", list(PALETTES)) if scheme != "Single colour" else "Plotly"
+    rules, bad_rules = parse_color_rules(st.sidebar.text_area(
+        "Colour rules, one per line: regex = hex colour (e.g. ^Opex = #d62728)", height=100
+    ))
+    if bad_rules:
+        st.sidebar.warning(f"Ignored invalid rules: {', '.join(bad_rules)}")
+    color_map = None
+    color_map_file = st.sidebar.file_uploader("Colour map file (columns: Node, Color)", type=["csv", "xlsx", "xls"])
+    if color_map_file:
+        try:
+            color_map = read_color_map(color_map_file)
+        except ValueError as e:
+            st.sidebar.error(str(e))
+    node_color_map = node_colors(unique_nodes, flows, scheme, palette, separator, rules, color_map)
+    overridden = st.sidebar.multiselect("Override colours for nodes", unique_nodes)
+    for node in overridden:
+        node_color_map[node] = st.sidebar.color_picker(f"{node}", node_color_map[node])
 
     fig = build_sankey(
         flows,
@@ -211,36 +233,48 @@ def main():
         opacity=link_opacity
     )
 
-    fig.update_layout(
-        title=dict(
-            text=chart_title,
-            font=dict(family=title_font_family, size=title_font_size)
-        ),
-        hovermode="x",
-        margin=dict(l=50, r=50, t=50, b=50),
-        width=1200,
-        height=700,
-        font=dict(
-            family=node_label_font_family,
-            size=node_label_font_size,
-            color="black"
-        )
-    )
+    fonts = (title_font_family, title_font_size, node_label_font_family, node_label_font_size)
+    style_sankey(fig, chart_title, *fonts)
+
+    exporter = get_exporter()
+    image_format = st.sidebar.radio("Export Format", list(IMAGE_FORMATS), format_func=str.upper, horizontal=True)
 
     st.plotly_chart(fig, use_container_width=True)
 
+    # Static images are rendered only on request (cached by figure spec), so styling reruns stay fast
     st.subheader("Export Diagram")
-    col1, col2 = st.columns(2)
-
-    with col1:
-        if st.button("Download as PNG"):
-            png_link = generate_download_link(fig, file_format="png")
-            st.markdown(png_link, unsafe_allow_html=True)
+    image = exporter.get(fig, image_format)
+    if image is None and st.button(f"Render {image_format.upper()}"):
+        try:
+            with st.spinner(f"Rendering {image_format.upper()}..."):
+                image = exporter.submit(fig, image_format)[1].result()
+        except Exception as e:
+            st.warning(f"Static image export is unavailable (requires Kaleido): {e}")
+    if image is not None:
+        st.download_button(
+            f"Download as {image_format.upper()}", image,
+            file_name=f"sankey_diagram.{image_format}", mime=IMAGE_FORMATS[image_format], on_click="ignore"
+        )
 
-    with col2:
-        if st.button("Download as SVG"):
-            svg_link = generate_download_link(fig, file_format="svg")
-            st.markdown(svg_link, unsafe_allow_html=True)
+    # Batch export: one diagram per value of an extra column in the uploaded file (e.g. cost centre)
+    split_columns = [c for c in source_flows.columns if c not in FLOW_COLUMNS]
+    if split_columns:
+        with st.expander("Batch Export"):
+            split_by = st.selectbox("One diagram per", split_columns)
+            if st.button(f"Render all as {image_format.upper()}"):
+                overrides = {node: node_color_map[node] for node in overridden}
+                figures = {}
+                for value, group in source_flows.groupby(split_by, sort=True):
+                    group_flows = prune_links(FlowHierarchy(group, separator).links(depth, expanded), top_n)
+                    group_nodes = sorted(pd.unique(group_flows[["Source", "Target"]].to_numpy().ravel()))
+                    group_colors = node_colors(group_nodes, group_flows, scheme, palette, separator, rules, color_map, overrides)
+                    group_fig = build_sankey(group_flows, group_colors, node_thickness, node_padding, link_opacity)
+                    figures[re.sub(r"[^\w.-]+", "_", str(value))] = style_sankey(group_fig, f"{chart_title} - {value}", *fonts)
+                with st.spinner(f"Rendering {len(figures)} diagrams in parallel..."):
+                    archive = exporter.export_many(figures, image_format)
+                st.download_button(
+                    "Download all (zip)", archive, file_name="sankey_diagrams.zip", mime="application/zip", on_click="ignore"
+                )
 
     st.markdown("""
     ---
@@ -0,0 +1,111 @@
+"""
+Rule-based node colours for the Sankey app.
+
+Colours are resolved for all nodes at once, in increasing priority:
+a base scheme (one colour, a palette over categories, or a palette over
+node levels), regex rules, an uploaded colour map, and finally the few
+nodes the user overrides by hand. Every colour is normalised to #rrggbb,
+the only form Streamlit's colour picker accepts.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from graph import link_levels
+
+HEX_COLOR = re.compile(r"^#(?:[0-9A-Fa-f]{3}){1,2}$")
+RGB_COLOR = re.compile(r"^rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*(?:,\s*[\d.]+\s*)?\)$")
+
+
+def to_hex(color):
+    """Normalise "#rgb", "#rrggbb" or "rgb(r, g, b)" to "#rrggbb"; returns None for anything else."""
+    color = str(color).strip()
+    if HEX_COLOR.match(color):
+        if len(color) == 4:
+            color = "#" + "".join(c * 2 for c in color[1:])
+        return color.lower()
+    match = RGB_COLOR.match(color)
+    if match and all(int(c) <= 255 for c in match.groups()):
+        return "#" + "".join(f"{int(c):02x}" for c in match.groups())
+    return None
+
+
+DEFAULT_COLOR = "#1f77b4"
+PALETTES = {
+    name: [to_hex(color) for color in colors]
+    for name, colors in {
+        "Plotly": px.colors.qualitative.Plotly,
+        "D3": px.colors.qualitative.D3,
+        "Set2": px.colors.qualitative.Set2,
+        "Pastel": px.colors.qualitative.Pastel,
+        "Dark24": px.colors.qualitative.Dark24,
+    }.items()
+}
+SCHEMES = ["Single colour", "By category", "By level"]
+RULE_PATTERN = re.compile(r"^(?P<pattern>.+?)\s*=\s*(?P<color>[^=]+?)\s*$")
+
+
+def node_levels(nodes, flows):
+    """Column of each node in the flow graph: 0 for nodes without inflow, else 1 + the deepest parent."""
+    codes = {node: i for i, node in enumerate(nodes)}
+    sources = flows["Source"].map(codes).to_numpy()
+    targets = flows["Target"].map(codes).to_numpy()
+    return link_levels(sources, targets, len(nodes))
+
+
+def parse_color_rules(text):
+    """Parse "regex = colour" lines (hex or rgb colours); returns ([(compiled pattern, colour)], [invalid lines])."""
+    rules, errors = [], []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = RULE_PATTERN.match(line.strip())
+        try:
+            color = to_hex(match["color"])
+            if color is None:
+                raise ValueError(match["color"])
+            rules.append((re.compile(match["pattern"]), color))
+        except (TypeError, ValueError, re.error):
+            errors.append(line)
+    return rules, errors
+
+
+def read_color_map(uploaded_file):
+    """Read a Node/Color table (CSV or Excel) into a {node: colour} dict."""
+    if uploaded_file.name.lower().endswith(".csv"):
+        df = pd.read_csv(uploaded_file)
+    else:
+        df = pd.read_excel(uploaded_file)
+    if not {"Node", "Color"}.issubset(df.columns):
+        raise ValueError("Colour map must contain columns: Node, Color")
+    df = df.dropna(subset=["Node", "Color"])
+    colors = df["Color"].map(to_hex)
+    if colors.isna().any():
+        invalid = ", ".join(df.loc[colors.isna(), "Color"].astype(str).unique()[:5])
+        raise ValueError(f"Colour map colours must be hex (#rrggbb) or rgb(r, g, b) values, got: {invalid}")
+    return dict(zip(df["Node"].astype(str), colors))
+
+
+def node_colors(nodes, flows, scheme="Single colour", palette="Plotly", separator=":", rules=(), color_map=None, overrides=None):
+    """Return {node: colour} for `nodes` under the given scheme, rules, colour map and overrides."""
+    nodes = pd.Series(nodes, dtype=object)
+    colors = PALETTES[palette]
+    if scheme == "By category":
+        categories, _ = pd.factorize(nodes.astype(str).str.split(separator, regex=False).str[0])
+        resolved = np.asarray(colors, dtype=object)[categories % len(colors)]
+    elif scheme == "By level":
+        resolved = np.asarray(colors, dtype=object)[node_levels(nodes, flows) % len(colors)]
+    else:
+        resolved = np.full(len(nodes), DEFAULT_COLOR, dtype=object)
+
+    # Later rules win, matching the order they are written in.
+    text = nodes.astype(str)
+    for pattern, color in rules:
+        resolved[text.str.contains(pattern, regex=True).to_numpy()] = color
+    for mapping in (color_map, overrides):
+        if mapping:
+            mapped = text.map(mapping)
+            resolved = np.where(mapped.notna(), mapped, resolved)
+    return dict(zip(nodes, resolved))
@@ -0,0 +1,115 @@
+"""
+Static image export for the Sankey app.
+
+Kaleido renders are slow, so they only run when the user asks for an
+image. Figures are rendered on a small process pool (each worker keeps its
+Kaleido renderer warm between jobs) and the resulting bytes are cached by
+a hash of the figure spec and image settings. Identical figures are
+rendered once; batches of figures render in parallel.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import plotly.io as pio
+
+IMAGE_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+DEFAULT_WIDTH = 1200
+DEFAULT_HEIGHT = 700
+MAX_CACHE_BYTES = 256 * 1024**2
+
+
+def render_image(spec, file_format, width, height):
+    """Render a figure JSON spec to image bytes (runs in a worker process)."""
+    return pio.to_image(pio.from_json(spec, skip_invalid=True), format=file_format, width=width, height=height)
+
+
+def export_key(spec, file_format, width, height):
+    """Cache key for one rendered image."""
+    digest = hashlib.blake2b(spec.encode(), digest_size=16)
+    digest.update(f"{file_format}:{width}x{height}".encode())
+    return digest.hexdigest()
+
+
+class ImageExporter:
+    """
+    Background renderer with an in-memory LRU of finished images.
+
+    `submit` returns a future for the image bytes; submitting a figure
+    that is already cached or being rendered returns the same result
+    without rendering it again.
+    """
+
+    def __init__(self, max_workers=None, max_bytes=MAX_CACHE_BYTES):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            # Spawned workers: forking the multi-threaded Streamlit server is unsafe.
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _store(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._images[key] = future.result()
+            size = sum(len(image) for image in self._images.values())
+            while size > self.max_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                size -= len(evicted)
+
+    def get(self, fig, file_format="png", width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+        """Return the cached image bytes for `fig`, or None if it hasn't been rendered yet."""
+        key = export_key(fig.to_json(), file_format, width, height)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+            return self._images.get(key)
+
+    def submit(self, fig, file_format="png", width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+        """Start rendering `fig` in the background; returns (key, future)."""
+        spec = fig.to_json()
+        key = export_key(spec, file_format, width, height)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                future = Future()
+                future.set_result(self._images[key])
+                return key, future
+            if key in self._pending:
+                return key, self._pending[key]
+            future = self._executor().submit(render_image, spec, file_format, width, height)
+            self._pending[key] = future
+        future.add_done_callback(lambda f, key=key: self._store(key, f))
+        return key, future
+
+    def export_many(self, figures, file_format="png", width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+        """
+        Render {name: figure} in parallel and return a zip archive of the images as bytes.
+
+        Figures that fail to render are listed in `errors.txt` inside the archive.
+        """
+        futures = {name: self.submit(fig, file_format, width, height)[1] for name, fig in figures.items()}
+        buffer = io.BytesIO()
+        errors = []
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, future in futures.items():
+                try:
+                    archive.writestr(f"{name}.{file_format}", future.result())
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+            if errors:
+                archive.writestr("errors.txt", "\n".join(errors))
+        return buffer.getvalue()
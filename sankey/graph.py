@@ -0,0 +1,171 @@
+"""
+Flow graph construction for the Sankey app.
+
+Flows are kept as a frame with Source, Amount and Target columns. Node
+indices come from `pd.factorize` (nodes keep their order of first
+appearance), and duplicate (source, target) pairs are summed into a
+single link, which keeps the figure small even for very large
+general-ledger extracts. Manually typed flows are parsed a whole text
+block at a time with Arrow string kernels.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+FLOW_COLUMNS = ["Source", "Amount", "Target"]
+# Patterns run on Arrow strings (RE2 syntax), so whole text blocks are parsed in native code.
+FLOW_LINE = r"^(?P<Source>[^\[\]]+)\[(?P<Amount>[^\[\]]*)\](?P<Target>[^\[\]]+)$"
+CURRENCY = r"(?i)[$€£¥₹\s]+|USD|EUR|GBP|JPY|CHF|CAD|AUD|INR"
+NUMBER_FORMATS = {"1,234.56": (",", "."), "1.234,56": (".", ",")}
+
+
+def flows_frame(flows, extra_columns=()):
+    """
+    Normalize a list of (source, amount, target) tuples or a frame into a clean flow frame.
+
+    `extra_columns` of a frame (e.g. a cost centre) are kept alongside the flow columns.
+    """
+    if isinstance(flows, pd.DataFrame):
+        df = flows[FLOW_COLUMNS + [c for c in extra_columns if c not in FLOW_COLUMNS]]
+    else:
+        df = pd.DataFrame(list(flows), columns=FLOW_COLUMNS)
+    df = df.assign(Amount=pd.to_numeric(df["Amount"], errors="coerce"))
+    return df.dropna(subset=FLOW_COLUMNS).reset_index(drop=True)
+
+
+def parse_amounts(amounts, number_format="1,234.56"):
+    """
+    Parse amount strings with currency symbols/codes and thousands separators.
+
+    Accounting negatives like "(1,200)" become -1200; anything else that
+    isn't a number becomes NaN.
+    """
+    thousands, decimal = NUMBER_FORMATS[number_format]
+    text = amounts.astype("string[pyarrow]").str.replace(CURRENCY, "", regex=True)
+    negative = text.str.match(r"^\(.*\)$").fillna(False).to_numpy(dtype=bool)
+    text = text.str.strip("()").str.replace(thousands, "", regex=False).str.replace("'", "", regex=False)
+    if decimal != ".":
+        text = text.str.replace(decimal, ".", regex=False)
+    values = pd.to_numeric(text, errors="coerce").astype(float).to_numpy()
+    return pd.Series(np.where(negative, -values, values), index=amounts.index)
+
+
+def parse_flow_lines(text, number_format="1,234.56"):
+    """
+    Parse "Source [Amount] Target" lines in one pass.
+
+    Returns (flows, errors): a flow frame and a frame of rejected lines
+    with their line number and the reason.
+    """
+    lines = pa.array(text.splitlines(), type=pa.string())
+    numbers = np.flatnonzero(pc.not_equal(pc.utf8_trim_whitespace(lines), "").to_numpy(zero_copy_only=False)) + 1
+    lines = lines.take(pa.array(numbers - 1))
+    parts = pc.extract_regex(lines, FLOW_LINE)
+    sources, amounts, targets = (
+        pd.Series(pc.utf8_trim_whitespace(pc.struct_field(parts, name)), dtype="string[pyarrow]", index=numbers)
+        for name in FLOW_COLUMNS
+    )
+    amounts = parse_amounts(amounts.fillna(""), number_format)
+
+    malformed = (sources.fillna("") == "") | (targets.fillna("") == "")
+    rejected = malformed | amounts.isna()
+    errors = pd.DataFrame({
+        "Line": numbers[rejected.to_numpy()],
+        "Text": lines.filter(pa.array(rejected.to_numpy())).to_pylist(),
+        "Error": np.where(malformed[rejected], "Expected: Source [Amount] Target", "Amount is not a number"),
+    })
+    flows = pd.DataFrame({
+        "Source": sources[~rejected].astype(object),
+        "Amount": amounts[~rejected],
+        "Target": targets[~rejected].astype(object),
+    })
+    return flows.reset_index(drop=True), errors
+
+
+def _first_rows(codes):
+    """Row of the first occurrence of each code (codes from `pd.factorize` appear in order)."""
+    return pd.Series(codes).drop_duplicates().index.to_numpy()
+
+
+def index_nodes(flows):
+    """
+    Return (labels, source codes, target codes) for a flow frame.
+
+    Sources and targets are factorized separately and their labels merged
+    by first appearance (row by row, source before target).
+    """
+    source_codes, source_labels = pd.factorize(flows["Source"])
+    target_codes, target_labels = pd.factorize(flows["Target"])
+    first_seen = np.concatenate([2 * _first_rows(source_codes), 2 * _first_rows(target_codes) + 1])
+    order = np.argsort(first_seen, kind="stable")
+    merged_codes, labels = pd.factorize(np.concatenate([source_labels, target_labels])[order])
+    lookup = np.empty(len(order), dtype=np.int64)
+    lookup[order] = merged_codes
+    return np.asarray(labels, dtype=object), lookup[source_codes], lookup[len(source_labels) + target_codes]
+
+
+def aggregate_links(sources, targets, amounts, n_nodes):
+    """Sum amounts of duplicate (source, target) links; returns (sources, targets, values)."""
+    keys = sources.astype(np.int64) * n_nodes + targets
+    link_codes, unique_keys = pd.factorize(keys)
+    values = np.bincount(link_codes, weights=amounts, minlength=len(unique_keys))
+    return unique_keys // n_nodes, unique_keys % n_nodes, values
+
+
+CYCLE_BREAKS = 64  # cycles broken one node at a time before placing all blocked nodes at once
+
+
+def link_levels(sources, targets, n_nodes):
+    """
+    Column of each node code: 0 for nodes without inflow, else 1 + the deepest parent.
+
+    Computed with a topological (Kahn) pass, so every link is visited once.
+    When only cycles are left (e.g. intercompany flows), one node on them is
+    placed one column after its deepest placed parent and the pass resumes
+    from there; after `CYCLE_BREAKS` such steps, all blocked nodes with a
+    placed parent are placed together so tangled graphs stay fast.
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    order = np.argsort(sources, kind="stable")
+    out_targets = targets[order]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=n_nodes))])
+    indegree = np.bincount(targets, minlength=n_nodes)
+
+    levels = np.full(n_nodes, -1, dtype=np.int64)
+    reach = np.zeros(n_nodes, dtype=np.int64)  # 1 + deepest placed parent so far
+    frontier = np.flatnonzero(indegree == 0)
+    breaks = 0
+    while True:
+        while len(frontier):
+            levels[frontier] = reach[frontier]
+            starts, counts = offsets[frontier], offsets[frontier + 1] - offsets[frontier]
+            links = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            children = out_targets[links]
+            np.maximum.at(reach, children, np.repeat(levels[frontier], counts) + 1)
+            np.subtract.at(indegree, children, 1)
+            frontier = np.unique(children[(indegree[children] == 0) & (levels[children] < 0)])
+        pending = levels < 0
+        if not pending.any():
+            return levels
+        candidates = np.flatnonzero(pending)
+        breaks += 1
+        if breaks > CYCLE_BREAKS and (reach[candidates] > 0).any():
+            frontier = candidates[reach[candidates] > 0]
+        else:
+            # Break one cycle: place the blocked node with the fewest unplaced parents (then the deepest placed one).
+            frontier = candidates[np.lexsort((candidates, -reach[candidates], indegree[candidates]))[:1]]
+
+
+def sankey_arrays(flows):
+    """
+    Plotly-ready arrays for a flow frame.
+
+    Returns (labels, sources, targets, values) with one link per distinct
+    (source, target) pair.
+    """
+    flows = flows_frame(flows)
+    labels, sources, targets = index_nodes(flows)
+    sources, targets, values = aggregate_links(sources, targets, flows["Amount"].to_numpy(dtype=float), len(labels))
+    return labels, sources, targets, values
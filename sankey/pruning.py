@@ -0,0 +1,174 @@
+"""
+Pruning large flow graphs before they reach the Sankey chart.
+
+Two stages run between loading the flows and `build_sankey`:
+
+* `FlowHierarchy` collapses chart-of-accounts labels such as
+  "Opex:Marketing:Digital" to a chosen depth. Individual nodes can be
+  expanded one level at a time; expanding only re-aggregates the links
+  that touch the expanded branch, everything else comes from the cached
+  collapsed graph.
+* `prune_links` keeps the top-N outgoing links of every node and merges
+  the rest into a shared "Other" node per diagram column, so every node
+  keeps its outgoing total and the node count actually goes down.
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from graph import aggregate_links, flows_frame, index_nodes, link_levels
+
+OTHER_LABEL = "Other"
+MAX_PRUNED = 16  # pruned graphs kept per hierarchy
+
+
+def _truncate(labels, separator, depth):
+    """Labels cut to their first `depth` segments."""
+    return pd.Series(labels, dtype=object).astype(str).str.split(separator, regex=False).str[:depth].str.join(separator).to_numpy(dtype=object)
+
+
+class FlowHierarchy:
+    """
+    Flows whose labels form a hierarchy, shown collapsed to a chosen depth.
+
+    Rows are first reduced to distinct (source, target) account pairs. For
+    each depth the collapsed graph, and the account pairs touching each
+    collapsed node, are computed once; `links(depth, expanded)` then only
+    re-aggregates the pairs under expanded nodes.
+    """
+
+    def __init__(self, flows, separator=":"):
+        flows = flows_frame(flows)
+        self.separator = separator
+        self.labels, sources, targets = index_nodes(flows)
+        self.sources, self.targets, self.values = aggregate_links(
+            sources, targets, flows["Amount"].to_numpy(dtype=float), len(self.labels)
+        )
+        self.segments = pd.Series(self.labels, dtype=object).astype(str).str.split(separator, regex=False)
+        self.max_depth = int(self.segments.str.len().max()) if len(self.labels) else 1
+        self._parents = None
+        self._collapsed = {}
+        self._pruned = OrderedDict()
+
+    def _collapse(self, depth):
+        """Collapsed groups, graph and per-group link slices for `depth` (computed once)."""
+        if depth not in self._collapsed:
+            group_of, groups = pd.factorize(_truncate(self.labels, self.separator, depth))
+            group_sources, group_targets = group_of[self.sources], group_of[self.targets]
+            self._collapsed[depth] = {
+                "groups": np.asarray(groups, dtype=object),
+                "index": {g: i for i, g in enumerate(groups)},
+                "links": aggregate_links(group_sources, group_targets, self.values, len(groups)),
+                "by_source": np.argsort(group_sources, kind="stable"),
+                "by_target": np.argsort(group_targets, kind="stable"),
+                "source_offsets": np.concatenate([[0], np.cumsum(np.bincount(group_sources, minlength=len(groups)))]),
+                "target_offsets": np.concatenate([[0], np.cumsum(np.bincount(group_targets, minlength=len(groups)))]),
+            }
+        return self._collapsed[depth]
+
+    def expandable(self, labels):
+        """The subset of `labels` that have children below them."""
+        if self._parents is None:
+            self._parents = {
+                self.separator.join(parts[:d]) for parts in self.segments for d in range(1, len(parts))
+            }
+        return [label for label in labels if label in self._parents]
+
+    def _display(self, accounts, depth, expanded):
+        """Label shown for each account: collapsed to `depth`, one level deeper per expanded ancestor."""
+        shown = []
+        for parts in self.segments.iloc[accounts]:
+            d = min(depth, len(parts))
+            while d < len(parts) and self.separator.join(parts[:d]) in expanded:
+                d += 1
+            shown.append(self.separator.join(parts[:d]))
+        return np.array(shown, dtype=object)
+
+    def links(self, depth=1, expanded=()):
+        """Flow frame collapsed to `depth` with the `expanded` nodes opened up; self-flows are dropped."""
+        collapsed = self._collapse(depth)
+        expanded = set(expanded)
+        ancestors = {self.separator.join(label.split(self.separator)[:depth]) for label in expanded}
+        affected = sorted(collapsed["index"][g] for g in ancestors if g in collapsed["index"])
+
+        groups = collapsed["groups"]
+        sources, targets, values = collapsed["links"]
+        keep = ~(np.isin(sources, affected) | np.isin(targets, affected))
+        frames = [pd.DataFrame({"Source": groups[sources[keep]], "Amount": values[keep], "Target": groups[targets[keep]]})]
+
+        # Only account pairs touching an expanded branch are re-aggregated.
+        by_source, by_target = collapsed["by_source"], collapsed["by_target"]
+        source_offsets, target_offsets = collapsed["source_offsets"], collapsed["target_offsets"]
+        slices = [by_source[source_offsets[g]:source_offsets[g + 1]] for g in affected]
+        slices += [by_target[target_offsets[g]:target_offsets[g + 1]] for g in affected]
+        touching = np.unique(np.concatenate(slices)) if slices else []
+        if len(touching):
+            accounts, codes = np.unique(np.concatenate([self.sources[touching], self.targets[touching]]), return_inverse=True)
+            shown = self._display(accounts, depth, expanded)
+            frames.append(
+                pd.DataFrame({
+                    "Source": shown[codes[:len(touching)]],
+                    "Amount": self.values[touching],
+                    "Target": shown[codes[len(touching):]],
+                }).groupby(["Source", "Target"], sort=False, as_index=False)["Amount"].sum()
+            )
+        flows = pd.concat(frames, ignore_index=True)[["Source", "Amount", "Target"]]
+        return flows[flows["Source"] != flows["Target"]].reset_index(drop=True)
+
+    def pruned(self, depth=1, expanded=(), top_n=10):
+        """`prune_links(links(depth, expanded), top_n)`, keeping the last few results so reruns skip it."""
+        key = (depth, frozenset(expanded), top_n)
+        if key in self._pruned:
+            self._pruned.move_to_end(key)
+        else:
+            self._pruned[key] = prune_links(self.links(depth, expanded), top_n)
+            while len(self._pruned) > MAX_PRUNED:
+                self._pruned.popitem(last=False)
+        return self._pruned[key]
+
+
+def prune_links(flows, top_n=10):
+    """
+    Keep each node's `top_n` largest outgoing links; merge the rest into "Other".
+
+    The merged tail becomes one link from the node to an "Other" node shared
+    by all sources in the same column ("Other (column N)" when tails sit in
+    several columns), so every source keeps its outgoing total. Nodes that
+    only received flows through merged links are dropped together with
+    everything downstream of them, since their amounts are already counted
+    in "Other".
+    """
+    flows = flows_frame(flows)
+    if not top_n or flows.empty:
+        return flows
+    labels, sources, targets = index_nodes(flows)
+    sources, targets, values = aggregate_links(sources, targets, flows["Amount"].to_numpy(dtype=float), len(labels))
+
+    order = np.lexsort((-values, sources))
+    rank = np.empty(len(order), dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, sources[order][1:] != sources[order][:-1]])
+    rank[order] = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    kept = rank < top_n
+
+    # Nodes fed only through merged links disappear, along with their downstream flows.
+    had_inflow = np.bincount(targets, minlength=len(labels)) > 0
+    while True:
+        has_inflow = np.bincount(targets[kept], minlength=len(labels)) > 0
+        orphaned = had_inflow & ~has_inflow
+        dropped = kept & orphaned[sources]
+        if not dropped.any():
+            break
+        kept &= ~dropped
+
+    tail = ~kept & ~orphaned[sources]
+    columns = link_levels(sources, targets, len(labels))[sources[tail]] + 1
+    other = pd.DataFrame({"Source": labels[sources[tail]], "Amount": values[tail], "Column": columns})
+    other = other.groupby(["Source", "Column"], sort=False, as_index=False)["Amount"].sum()
+    if other["Column"].nunique() > 1:
+        other["Target"] = [f"{OTHER_LABEL} (column {column + 1})" for column in other["Column"]]
+    else:
+        other["Target"] = OTHER_LABEL
+    other = other[["Source", "Amount", "Target"]]
+    main = pd.DataFrame({"Source": labels[sources[kept]], "Amount": values[kept], "Target": labels[targets[kept]]})
+    return pd.concat([main, other], ignore_index=True)
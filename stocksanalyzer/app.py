@@ -1,102 +1,217 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from datetime import date
+from market_data import DATA_SOURCES, MarketDataFetcher
+from indicators import compute_indicators
+from correlation import block_average, cluster_order, correlation_matrix, top_pairs
+from resampling import DEFAULT_POINT_BUDGET, downsample_series, resample_ohlcv
+from portfolio import REBALANCE_PERIODS, backtest, drawdowns, normalize_weights, risk_metrics
+from montecarlo import MODELS, fan_chart_frame, portfolio_log_returns, simulate, terminal_risk
 
 # App Title
 st.title("Stock Market Visualizer with Enhanced Analytics")
 st.sidebar.title("Options")
 
 # Helper Functions
-def fetch_stock_data(ticker, start_date, end_date):
-    """Fetch stock data using yfinance."""
-    stock = yf.Ticker(ticker)
-    return stock.history(start=start_date, end=end_date)
+@st.cache_resource
+def get_fetcher(source_name):
+    """One fetcher (and local OHLCV store) per data source, shared across reruns."""
+    return MarketDataFetcher(DATA_SOURCES[source_name]())
 
-def plot_candlestick(data):
-    """Plot a candlestick chart."""
+def fetch_stock_data(fetcher, ticker, start_date, end_date):
+    """Fetch stock data through the incremental store (empty frame on failure)."""
+    try:
+        return fetcher.fetch(ticker, start_date, end_date)
+    except Exception as e:
+        st.error(f"Could not fetch data for {ticker}: {e}")
+        return pd.DataFrame()
+
+@st.cache_data(show_spinner=False, max_entries=64, ttl=3600)
+def get_indicators(source_name, ticker, start_date, end_date, windows, _data):
+    """All indicators for one ticker and range, computed in one batch and cached."""
+    return compute_indicators(_data, ma_windows=windows)
+
+def line_trace(series, name, budget):
+    """Line trace downsampled with LTTB to at most `budget` points."""
+    reduced = downsample_series(series, budget)
+    return go.Scatter(x=reduced.index, y=reduced, mode='lines', name=name)
+
+def plot_candlestick(data, budget):
+    """Plot a candlestick chart (aggregated to coarser bars beyond the point budget)."""
+    bars, bar_size = resample_ohlcv(data, budget)
     fig = go.Figure()
     fig.add_trace(go.Candlestick(
-        x=data.index,
-        open=data['Open'],
-        high=data['High'],
-        low=data['Low'],
-        close=data['Close'],
+        x=bars.index,
+        open=bars['Open'],
+        high=bars['High'],
+        low=bars['Low'],
+        close=bars['Close'],
         name="Candlestick"
     ))
-    fig.update_layout(title="Candlestick Chart", xaxis_title="Date", yaxis_title="Price", template="plotly_dark")
+    fig.update_layout(title=f"Candlestick Chart ({bar_size} bars)", xaxis_title="Date", yaxis_title="Price", template="plotly_dark")
     st.plotly_chart(fig)
 
-def plot_volume(data):
+def plot_volume(data, budget):
     """Plot a volume chart."""
-    fig = px.bar(data, x=data.index, y='Volume', title="Trading Volume", template="plotly_dark")
+    bars, bar_size = resample_ohlcv(data, budget)
+    fig = px.bar(bars, x=bars.index, y='Volume', title=f"Trading Volume ({bar_size})", template="plotly_dark")
     st.plotly_chart(fig)
 
-def plot_daily_returns(data):
+def plot_daily_returns(indicators, budget):
     """Plot daily returns."""
-    data['Daily Return'] = data['Close'].pct_change() * 100
-    fig = px.line(data, x=data.index, y='Daily Return', title="Daily Returns (%)", template="plotly_dark")
+    fig = go.Figure(line_trace(indicators['Daily Return'], "Daily Return", budget))
+    fig.update_layout(title="Daily Returns (%)", xaxis_title="Date", template="plotly_dark")
     st.plotly_chart(fig)
 
-def plot_cumulative_returns(data):
+def plot_cumulative_returns(indicators, budget):
     """Plot cumulative returns."""
-    data['Cumulative Return'] = (1 + data['Close'].pct_change()).cumprod() - 1
-    fig = px.line(data, x=data.index, y='Cumulative Return', title="Cumulative Returns", template="plotly_dark")
+    fig = go.Figure(line_trace(indicators['Cumulative Return'], "Cumulative Return", budget))
+    fig.update_layout(title="Cumulative Returns", xaxis_title="Date", template="plotly_dark")
     st.plotly_chart(fig)
 
-def plot_moving_averages(data, windows):
+def plot_moving_averages(data, indicators, windows, budget):
     """Plot moving averages."""
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=data.index, y=data['Close'], mode='lines', name="Close Price"))
+    fig.add_trace(line_trace(data['Close'], "Close Price", budget))
     for window in windows:
-        data[f"MA{window}"] = data['Close'].rolling(window=window).mean()
-        fig.add_trace(go.Scatter(x=data.index, y=data[f"MA{window}"], mode='lines', name=f"MA {window}"))
+        fig.add_trace(line_trace(indicators[f"MA{window}"], f"MA {window}", budget))
     fig.update_layout(title="Moving Averages", xaxis_title="Date", yaxis_title="Price", template="plotly_dark")
     st.plotly_chart(fig)
 
-def plot_correlation_matrix(data):
+def plot_indicator(data, indicators, name, budget):
+    """Plot one of the batch-computed technical indicators."""
+    fig = go.Figure()
+    if name == "Bollinger Bands":
+        fig.add_trace(line_trace(data['Close'], "Close Price", budget))
+        for band in ("Upper", "Middle", "Lower"):
+            fig.add_trace(line_trace(indicators[f"Bollinger {band}"], band, budget))
+    elif name == "EMA":
+        fig.add_trace(line_trace(data['Close'], "Close Price", budget))
+        for column in [c for c in indicators.columns if c.startswith("EMA")]:
+            fig.add_trace(line_trace(indicators[column], column, budget))
+    else:
+        fig.add_trace(line_trace(indicators[name], name, budget))
+    fig.update_layout(title=name, xaxis_title="Date", template="plotly_dark")
+    st.plotly_chart(fig)
+
+@st.cache_data(show_spinner="Computing correlations...", max_entries=16, ttl=3600)
+def get_correlations(source_name, tickers, start_date, end_date, window, lookback, halflife, shrinkage, _prices):
+    """Pairwise-complete return correlations for the portfolio, cached per settings."""
+    return correlation_matrix(_prices, window=window, lookback=lookback, halflife=halflife, shrinkage=shrinkage)
+
+def plot_correlation_matrix(corr):
     """Plot correlation matrix for stock portfolio."""
-    corr = data.corr()
-    fig = px.imshow(corr, title="Correlation Matrix", template="plotly_dark", text_auto=True, color_continuous_scale='RdBu_r')
+    annotate = len(corr) <= 25
+    if not annotate:
+        # Large portfolios: cluster-ordered, unannotated, block-averaged beyond the heatmap cell limit
+        order = cluster_order(corr)
+        corr = block_average(corr.loc[order, order])
+    fig = px.imshow(corr, title="Correlation Matrix", template="plotly_dark", text_auto=".2f" if annotate else False,
+                    color_continuous_scale='RdBu_r', zmin=-1, zmax=1)
+    st.plotly_chart(fig)
+
+@st.cache_data(show_spinner="Running backtest...", max_entries=16, ttl=3600)
+def get_backtest(source_name, tickers, weights, start_date, end_date, period, cost_bps, _prices):
+    """Vectorized portfolio backtest, cached per portfolio and settings."""
+    return backtest(_prices, weights, period=period, cost_bps=cost_bps)
+
+def plot_backtest(result, budget):
+    """Plot the portfolio equity curve and its drawdowns."""
+    fig = go.Figure(line_trace(result['value'], "Portfolio Value", budget))
+    fig.update_layout(title="Portfolio Value (start = 1)", xaxis_title="Date", template="plotly_dark")
+    st.plotly_chart(fig)
+    fig = go.Figure(line_trace(drawdowns(result['value']), "Drawdown", budget))
+    fig.update_layout(title="Portfolio Drawdown", xaxis_title="Date", template="plotly_dark")
+    st.plotly_chart(fig)
+
+@st.cache_data(show_spinner="Simulating paths...", max_entries=8, ttl=3600)
+def get_simulation(source_name, tickers, weights, start_date, end_date, model, n_paths, horizon, block_length, seed, _prices):
+    """Monte Carlo fan chart and horizon risk for the portfolio (only the small summaries are cached)."""
+    log_returns = portfolio_log_returns(_prices, weights)
+    accumulator = simulate(log_returns, model=model, n_paths=n_paths, horizon=horizon, seed=seed, block_length=block_length)
+    days = pd.bdate_range(_prices.index[-1], periods=horizon + 1)
+    centers, counts = accumulator.terminal_distribution()
+    return fan_chart_frame(accumulator, index=days), terminal_risk(accumulator), pd.Series(counts, index=centers)
+
+def plot_fan_chart(fan):
+    """Plot simulated portfolio value quantile bands."""
+    fig = go.Figure()
+    for low, high, opacity in (("P5", "P95", 0.2), ("P25", "P75", 0.4)):
+        fig.add_trace(go.Scatter(x=fan.index, y=fan[high], mode='lines', line=dict(width=0), showlegend=False))
+        fig.add_trace(go.Scatter(x=fan.index, y=fan[low], mode='lines', line=dict(width=0), fill='tonexty',
+                                 fillcolor=f"rgba(99, 110, 250, {opacity})", name=f"{low}-{high}"))
+    fig.add_trace(go.Scatter(x=fan.index, y=fan["P50"], mode='lines', name="Median"))
+    fig.add_trace(go.Scatter(x=fan.index, y=fan["Mean"], mode='lines', name="Mean", line=dict(dash='dash')))
+    fig.update_layout(title="Simulated Portfolio Value (start = 1)", xaxis_title="Date", template="plotly_dark")
+    st.plotly_chart(fig)
+
+def plot_terminal_distribution(distribution):
+    """Plot the distribution of simulated portfolio values at the horizon."""
+    distribution = distribution[distribution > 0]
+    fig = px.bar(x=distribution.index, y=distribution.to_numpy(), title="Portfolio Value at Horizon",
+                 labels={'x': "Value", 'y': "Paths"}, template="plotly_dark")
     st.plotly_chart(fig)
 
 # Inputs
 st.sidebar.header("Stock Selection")
+data_source = st.sidebar.selectbox("Data Source", list(DATA_SOURCES))
+fetcher = get_fetcher(data_source)
 ticker = st.sidebar.text_input("Enter Stock Ticker (e.g., AAPL)", value="AAPL")
 start_date = st.sidebar.date_input("Start Date", value=date(2020, 1, 1))
 end_date = st.sidebar.date_input("End Date", value=date.today())
 
-data = fetch_stock_data(ticker, start_date, end_date)
+data = fetch_stock_data(fetcher, ticker, start_date, end_date)
 
 # Visualizations
 if not data.empty:
     st.subheader(f"Stock Data for {ticker}")
     st.write(data.tail())
 
+    # Chart resolution: charts stay under the point budget; zooming in brings back full-resolution bars
+    st.sidebar.header("Chart Resolution")
+    point_budget = st.sidebar.slider("Max Points per Chart", 500, 10000, DEFAULT_POINT_BUDGET, step=500)
+    first_day, last_day = data.index[0].date(), data.index[-1].date()
+    if first_day < last_day:
+        zoom_start, zoom_end = st.sidebar.slider("Zoom Window", first_day, last_day, (first_day, last_day))
+    else:
+        zoom_start, zoom_end = first_day, last_day
+    view = data.loc[pd.Timestamp(zoom_start):pd.Timestamp(zoom_end) + pd.Timedelta(days=1)]
+    if len(view) > point_budget:
+        st.caption(f"{len(view):,} bars in view: charts are aggregated/downsampled to {point_budget:,} points. Narrow the zoom window for full resolution.")
+
     # Candlestick Chart
     st.subheader("Candlestick Chart")
-    plot_candlestick(data)
+    plot_candlestick(view, point_budget)
 
     # Volume Chart
     st.subheader("Volume Chart")
-    plot_volume(data)
+    plot_volume(view, point_budget)
+
+    # Indicators are computed once per ticker, range and window set (the source data is never mutated)
+    st.sidebar.header("Moving Averages")
+    moving_averages = st.sidebar.multiselect("Select Moving Averages (days)", options=[10, 20, 50, 100, 200], default=[20, 50])
+    indicators = get_indicators(data_source, ticker, start_date, end_date, tuple(sorted(moving_averages)), data)
+    indicators = indicators.loc[view.index[0]:view.index[-1]] if not view.empty else indicators.iloc[:0]
 
     # Daily Returns
     st.subheader("Daily Returns")
-    plot_daily_returns(data)
+    plot_daily_returns(indicators, point_budget)
 
     # Cumulative Returns
     st.subheader("Cumulative Returns")
-    plot_cumulative_returns(data)
+    plot_cumulative_returns(indicators, point_budget)
 
     # Moving Averages
-    st.sidebar.header("Moving Averages")
-    moving_averages = st.sidebar.multiselect("Select Moving Averages (days)", options=[10, 20, 50, 100, 200], default=[20, 50])
     if moving_averages:
         st.subheader("Moving Averages")
-        plot_moving_averages(data, moving_averages)
+        plot_moving_averages(view, indicators, moving_averages, point_budget)
+
+    # Technical Indicators
+    st.subheader("Technical Indicators")
+    indicator = st.selectbox("Select Indicator", ["Bollinger Bands", "RSI", "Volatility", "Drawdown", "EMA"])
+    plot_indicator(view, indicators, indicator, point_budget)
 
 # Portfolio Correlation
 st.sidebar.header("Portfolio Analysis")
@@ -107,7 +222,71 @@ if portfolio_file:
     st.subheader("Portfolio Data")
     st.write(portfolio)
 
-    portfolio_data = {t: fetch_stock_data(t, start_date, end_date)['Close'] for t in tickers}
+    # Only date ranges missing from the local store are fetched, concurrently and batched where possible
+    frames, failures = fetcher.fetch_many(tickers, start_date, end_date)
+    if failures:
+        st.warning(f"Could not fetch: {', '.join(failures)}")
+    portfolio_data = {t: frames[t]['Close'] for t in tickers if t in frames and not frames[t].empty}
     portfolio_df = pd.DataFrame(portfolio_data)
+
     st.subheader("Correlation Matrix")
-    plot_correlation_matrix(portfolio_df)
+    window_label = st.sidebar.selectbox("Correlation Window", ["Full period", "Rolling", "EWMA"])
+    window = {"Full period": "full", "Rolling": "rolling", "EWMA": "ewma"}[window_label]
+    lookback = st.sidebar.slider("Rolling Window (days)", 20, 756, 252) if window == "rolling" else None
+    halflife = st.sidebar.slider("EWMA Half-life (days)", 5, 252, 63) if window == "ewma" else None
+    shrinkage_label = st.sidebar.selectbox("Shrinkage", ["None", "Auto (Schäfer-Strimmer)", "Manual"])
+    shrinkage = {"None": 0.0, "Auto (Schäfer-Strimmer)": "auto"}.get(shrinkage_label)
+    if shrinkage is None:
+        shrinkage = st.sidebar.slider("Shrinkage Intensity", 0.0, 1.0, 0.1)
+
+    corr, overlaps, intensity = get_correlations(
+        data_source, tuple(portfolio_df.columns), start_date, end_date, window, lookback, halflife, shrinkage, portfolio_df
+    )
+    if intensity:
+        st.caption(f"Off-diagonal correlations shrunk towards zero by {intensity:.1%}.")
+    plot_correlation_matrix(corr)
+
+    st.subheader("Most Correlated Pairs")
+    pair_kind = st.radio("Rank by", ["positive", "negative", "absolute"], horizontal=True)
+    st.dataframe(top_pairs(corr, overlaps, k=20, by=pair_kind))
+
+    # Portfolio Backtest: target weights from the file's Weight column (equal weights otherwise)
+    st.subheader("Portfolio Backtest")
+    rebalance_label = st.sidebar.selectbox("Rebalancing", list(REBALANCE_PERIODS), index=3)
+    cost_bps = st.sidebar.number_input("Transaction Cost (bps)", 0.0, 100.0, 5.0, step=1.0)
+    risk_free = st.sidebar.number_input("Risk-free Rate (%)", 0.0, 20.0, 0.0, step=0.25) / 100
+    if not portfolio_df.empty:
+        if 'Weight' in portfolio.columns:
+            target = portfolio.groupby('Ticker')['Weight'].sum().reindex(portfolio_df.columns).to_numpy()
+            weights = normalize_weights(portfolio_df.columns, target)
+        else:
+            weights = normalize_weights(portfolio_df.columns)
+        result = get_backtest(
+            data_source, tuple(portfolio_df.columns), tuple(weights), start_date, end_date,
+            REBALANCE_PERIODS[rebalance_label], cost_bps, portfolio_df.sort_index(),
+        )
+        metrics = risk_metrics(result['returns'], risk_free=risk_free, turnover=result['turnover'])
+        columns = st.columns(3)
+        for i, (name, value) in enumerate(metrics.items()):
+            text = f"{value:.2f}" if "Ratio" in name else f"{value:.2%}"
+            columns[i % 3].metric(name, text)
+        plot_backtest(result, point_budget if not data.empty else DEFAULT_POINT_BUDGET)
+        st.write("Current (drifted) weights vs. target")
+        st.dataframe(pd.DataFrame({"Target": weights, "Current": result['weights']}, index=portfolio_df.columns))
+
+        # Monte Carlo: paths are simulated in blocks on a process pool and reduced to quantiles as they go
+        st.subheader("Monte Carlo Simulation")
+        model_label = st.sidebar.selectbox("Simulation Model", list(MODELS))
+        n_paths = st.sidebar.select_slider("Simulated Paths", [10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000], value=100_000)
+        horizon = st.sidebar.slider("Horizon (trading days)", 21, 756, 252, step=21)
+        block_length = st.sidebar.slider("Bootstrap Block (days)", 1, 21, 5) if MODELS[model_label] == "bootstrap" else 1
+        seed = st.sidebar.number_input("Random Seed", 0, 2**31 - 1, 0)
+        fan, horizon_risk, distribution = get_simulation(
+            data_source, tuple(portfolio_df.columns), tuple(weights), start_date, end_date,
+            MODELS[model_label], n_paths, horizon, block_length, int(seed), portfolio_df.sort_index(),
+        )
+        columns = st.columns(len(horizon_risk))
+        for column, (name, value) in zip(columns, horizon_risk.items()):
+            column.metric(name, f"{value:.2f}" if "Value" in name else f"{value:.2%}")
+        plot_fan_chart(fan)
+        plot_terminal_distribution(distribution)
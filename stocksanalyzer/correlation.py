@@ -0,0 +1,204 @@
+"""
+Portfolio correlation and covariance for the Stock Market Visualizer.
+
+Works on daily returns of tickers with ragged histories: every pair uses
+the days on which both tickers traded (pairwise-complete observations).
+Sufficient statistics are accumulated over blocks of rows with masked
+matrix products, so thousands of tickers never need per-pair Python loops.
+"""
+import numpy as np
+import pandas as pd
+
+MIN_OBSERVATIONS = 20
+MAX_HEATMAP_SIDE = 400
+BLOCK_ROWS = 512
+
+
+def daily_returns(prices):
+    """Simple daily returns; days before a ticker's first price stay NaN."""
+    return prices.sort_index().pct_change(fill_method=None).iloc[1:]
+
+
+def ewma_weights(n_rows, halflife):
+    """Observation weights decaying by half every `halflife` rows, newest = 1."""
+    return 0.5 ** (np.arange(n_rows)[::-1] / halflife)
+
+
+class PairwiseMoments:
+    """
+    Weighted pairwise-complete sums for covariance and correlation.
+
+    `update` can be called with consecutive blocks of rows; entry [i, j] of
+    each matrix only sees rows where both column i and column j are present.
+    """
+
+    def __init__(self, n_columns):
+        shape = (n_columns, n_columns)
+        self.weight = np.zeros(shape)  # sum of weights (= observation count when unweighted)
+        self.count = np.zeros(shape)  # number of overlapping observations
+        self.sx = np.zeros(shape)
+        self.sxx = np.zeros(shape)
+        self.sxy = np.zeros(shape)
+
+    def update(self, values, weights=None):
+        present = ~np.isnan(values)
+        x = np.where(present, values, 0.0)
+        mask = present.astype(float)
+        w = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+        wmask = mask * w[:, None]
+        wx = x * w[:, None]
+
+        self.count += mask.T @ mask
+        self.weight += wmask.T @ mask
+        self.sx += wx.T @ mask
+        self.sxx += (wx * x).T @ mask
+        self.sxy += wx.T @ x
+
+    def covariance(self, unbiased=True):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_x = self.sx / self.weight
+            mean_y = mean_x.T
+            cov = self.sxy / self.weight - mean_x * mean_y
+            if unbiased:
+                cov *= self.weight / (self.weight - 1)
+        return cov
+
+    def correlation(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_x = self.sx / self.weight
+            mean_y = mean_x.T
+            cov = self.sxy / self.weight - mean_x * mean_y
+            var_x = self.sxx / self.weight - mean_x**2
+            var_y = var_x.T
+            corr = cov / np.sqrt(var_x * var_y)
+        corr[(var_x <= 0) | (var_y <= 0)] = np.nan
+        return np.clip(corr, -1.0, 1.0)
+
+
+def pairwise_moments(returns, weights=None, block_rows=BLOCK_ROWS):
+    """Accumulate `PairwiseMoments` over `returns` in blocks of rows."""
+    values = returns.to_numpy(dtype=float)
+    moments = PairwiseMoments(values.shape[1])
+    for start in range(0, len(values), block_rows):
+        block_weights = None if weights is None else weights[start:start + block_rows]
+        moments.update(values[start:start + block_rows], block_weights)
+    return moments
+
+
+def shrinkage_intensity(returns):
+    """
+    Schäfer-Strimmer optimal shrinkage of correlations towards zero.
+
+    Estimated from standardized returns with pairwise-complete observations:
+    sum of the estimated variances of the off-diagonal correlations divided
+    by the sum of their squares, clipped to [0, 1].
+    """
+    values = returns.to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (values - np.nanmean(values, axis=0)) / np.nanstd(values, axis=0, ddof=1)
+    z = np.where(present & np.isfinite(z), z, 0.0)
+    mask = present.astype(float)
+
+    n = mask.T @ mask
+    s1 = z.T @ z
+    s2 = (z * z).T @ (z * z)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = s1 / (n - 1)
+        var_r = n / (n - 1) ** 3 * (s2 - s1**2 / n)
+    off_diagonal = ~np.eye(len(n), dtype=bool) & (n > 2)
+    denominator = np.nansum(r[off_diagonal] ** 2)
+    if denominator == 0:
+        return 0.0
+    return float(np.clip(np.nansum(var_r[off_diagonal]) / denominator, 0.0, 1.0))
+
+
+def correlation_matrix(prices, window="full", lookback=252, halflife=63, shrinkage=0.0, min_observations=MIN_OBSERVATIONS):
+    """
+    Correlation of daily returns for every pair of tickers in `prices`.
+
+    `window` is "full" (all days), "rolling" (last `lookback` days) or
+    "ewma" (exponentially weighted with `halflife` days). `shrinkage` is a
+    fixed intensity in [0, 1] or "auto" for the Schäfer-Strimmer estimate;
+    off-diagonal correlations are scaled by (1 - intensity). Pairs with
+    fewer than `min_observations` overlapping days are NaN.
+
+    Returns (correlation frame, overlap counts, shrinkage intensity used).
+    """
+    returns = daily_returns(prices)
+    if window == "rolling":
+        returns = returns.iloc[-lookback:]
+    weights = ewma_weights(len(returns), halflife) if window == "ewma" else None
+
+    moments = pairwise_moments(returns, weights)
+    corr = moments.correlation()
+    corr[moments.count < min_observations] = np.nan
+
+    intensity = shrinkage_intensity(returns) if shrinkage == "auto" else float(shrinkage)
+    if intensity:
+        diagonal = np.diag(corr).copy()
+        corr *= 1 - intensity
+        np.fill_diagonal(corr, diagonal)
+
+    columns = prices.columns
+    return (
+        pd.DataFrame(corr, index=columns, columns=columns),
+        pd.DataFrame(moments.count, index=columns, columns=columns),
+        intensity,
+    )
+
+
+def cluster_order(corr):
+    """Tickers in hierarchical-clustering (average linkage on 1 - |r|) leaf order."""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+
+    if len(corr) < 3:
+        return list(corr.columns)
+    distance = 1.0 - np.abs(np.nan_to_num(corr.to_numpy()))
+    distance = (distance + distance.T) / 2
+    np.fill_diagonal(distance, 0.0)
+    order = leaves_list(linkage(squareform(distance, checks=False), method="average"))
+    return [corr.columns[i] for i in order]
+
+
+def block_average(corr, max_side=MAX_HEATMAP_SIDE):
+    """Average a (cluster-ordered) matrix over contiguous blocks so it has at most `max_side` rows."""
+    n = len(corr)
+    if n <= max_side:
+        return corr
+    groups = np.arange(n) * max_side // n
+    labels = [f"{corr.index[g == groups][0]}…" for g in range(max_side)]
+    values = corr.to_numpy()
+    sums = np.zeros((max_side, max_side))
+    counts = np.zeros((max_side, max_side))
+    valid = ~np.isnan(values)
+    np.add.at(sums, (groups[:, None], groups[None, :]), np.where(valid, values, 0.0))
+    np.add.at(counts, (groups[:, None], groups[None, :]), valid)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame(sums / counts, index=labels, columns=labels)
+
+
+def top_pairs(corr, counts, k=20, by="positive"):
+    """
+    The `k` most correlated pairs.
+
+    `by` is "positive" (highest r), "negative" (lowest r) or "absolute".
+    """
+    values = corr.to_numpy()
+    i, j = np.triu_indices(len(values), k=1)
+    r = values[i, j]
+    keep = ~np.isnan(r)
+    i, j, r = i[keep], j[keep], r[keep]
+    score = {"positive": r, "negative": -r, "absolute": np.abs(r)}[by]
+    k = min(k, len(r))
+    if k == 0:
+        return pd.DataFrame(columns=["Ticker A", "Ticker B", "Correlation", "Observations"])
+    best = np.argpartition(-score, k - 1)[:k]
+    best = best[np.argsort(-score[best])]
+    return pd.DataFrame({
+        "Ticker A": corr.columns[i[best]],
+        "Ticker B": corr.columns[j[best]],
+        "Correlation": r[best],
+        "Observations": counts.to_numpy()[i[best], j[best]].astype(int),
+    })
@@ -0,0 +1,103 @@
+"""
+Technical indicators for the Stock Market Visualizer.
+
+All indicators for a price series are computed in one batch and returned
+as a new frame; the source data is never modified. Rolling means and
+standard deviations for any number of windows share a single set of
+prefix-sum arrays.
+"""
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+
+class PrefixSums:
+    """Prefix sums of values, squares and valid-observation counts for O(1) window statistics."""
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        # Centre the series so sums of squares don't swamp the variance.
+        shift = np.nanmean(values) if valid.any() else 0.0
+        centered = np.where(valid, values - shift, 0.0)
+        self.shift = shift
+        self.sum = np.concatenate([[0.0], np.cumsum(centered)])
+        self.sum_sq = np.concatenate([[0.0], np.cumsum(centered * centered)])
+        self.count = np.concatenate([[0], np.cumsum(valid)])
+
+    def _window(self, prefix, window):
+        totals = np.full(len(prefix) - 1, np.nan)
+        if window <= len(totals):
+            totals[window - 1:] = prefix[window:] - prefix[:-window]
+        return totals
+
+    def mean(self, window):
+        """Rolling mean, NaN until `window` valid observations are available (like pandas)."""
+        n = self._window(self.count, window)
+        return np.where(n == window, self._window(self.sum, window) / window + self.shift, np.nan)
+
+    def std(self, window):
+        """Rolling sample standard deviation over `window` observations."""
+        n = self._window(self.count, window)
+        s = self._window(self.sum, window)
+        ss = self._window(self.sum_sq, window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var = (ss - s * s / window) / (window - 1)
+        return np.where(n == window, np.sqrt(np.maximum(var, 0.0)), np.nan)
+
+
+def compute_indicators(
+    data,
+    ma_windows=(20, 50),
+    ema_spans=(12, 26),
+    volatility_window=21,
+    rsi_window=14,
+    bollinger_window=20,
+    bollinger_width=2.0,
+):
+    """
+    Return a frame of indicators aligned with `data.index`.
+
+    Columns: MA{w} per moving-average window, EMA{s} per span, Daily Return
+    (%), Log Return, Cumulative Return, Volatility (annualized rolling std of
+    log returns), RSI, Bollinger Upper/Middle/Lower and Drawdown.
+    """
+    close = data["Close"].to_numpy(dtype=float)
+    out = {}
+
+    prices = PrefixSums(close)
+    for window in ma_windows:
+        out[f"MA{window}"] = prices.mean(window)
+
+    close_series = pd.Series(close, index=data.index)
+    for span in ema_spans:
+        out[f"EMA{span}"] = close_series.ewm(span=span, adjust=False).mean().to_numpy()
+
+    previous = np.concatenate([[np.nan], close[:-1]])
+    simple = close / previous - 1
+    log_returns = np.log(close / previous)
+    out["Daily Return"] = simple * 100
+    out["Log Return"] = log_returns
+    out["Cumulative Return"] = close / close[0] - 1 if len(close) else close
+
+    returns = PrefixSums(log_returns)
+    out["Volatility"] = returns.std(volatility_window) * np.sqrt(TRADING_DAYS)
+
+    # Wilder's RSI: exponential smoothing of gains and losses with alpha = 1 / window.
+    change = pd.Series(close - previous, index=data.index)
+    gains = change.clip(lower=0).ewm(alpha=1 / rsi_window, adjust=False, min_periods=rsi_window).mean()
+    losses = (-change.clip(upper=0)).ewm(alpha=1 / rsi_window, adjust=False, min_periods=rsi_window).mean()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["RSI"] = (100 - 100 / (1 + gains / losses)).to_numpy()
+
+    middle = prices.mean(bollinger_window)
+    width = bollinger_width * prices.std(bollinger_window)
+    out["Bollinger Middle"] = middle
+    out["Bollinger Upper"] = middle + width
+    out["Bollinger Lower"] = middle - width
+
+    running_max = np.fmax.accumulate(close) if len(close) else close
+    out["Drawdown"] = close / running_max - 1
+
+    return pd.DataFrame(out, index=data.index)
@@ -0,0 +1,302 @@
+"""
+Market data access for the Stock Market Visualizer.
+
+Prices come from a pluggable source (Yahoo Finance by default, or a
+deterministic synthetic source for offline use), are fetched concurrently
+with retry/backoff, and are kept in an incremental on-disk store so only
+date ranges that were never fetched go back to the source.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.environ.get(
+    "PRICE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "stocksanalyzer-prices")
+)
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+MAX_CLOSED_DAYS = 5  # longer empty answers are treated as failures, not market holidays
+
+
+# ------------
+# Data sources
+# ------------
+class YFinanceSource:
+    """Daily bars from Yahoo Finance via yfinance."""
+
+    batch_size = 50
+
+    def history(self, ticker, start, end):
+        import yfinance as yf
+
+        return yf.Ticker(ticker).history(start=start, end=end)
+
+    def download(self, tickers, start, end):
+        """Fetch several tickers in one request; returns {ticker: frame}, omitting tickers without data."""
+        import yfinance as yf
+
+        data = yf.download(
+            list(tickers), start=start, end=end, group_by="ticker",
+            auto_adjust=True, threads=False, progress=False,
+        )
+        frames = {}
+        for ticker in tickers:
+            if ticker in data.columns.get_level_values(0):
+                frame = data[ticker].dropna(how="all")
+                if not frame.empty:
+                    frames[ticker] = frame
+        return frames
+
+
+class SyntheticSource:
+    """
+    Deterministic random-walk bars, seeded by ticker.
+
+    Useful offline and as a stand-in provider for testing: the same ticker
+    always yields the same prices for the same business days.
+    """
+
+    batch_size = None
+
+    def __init__(self, origin=date(1990, 1, 1)):
+        self.origin = pd.Timestamp(origin)
+
+    def history(self, ticker, start, end):
+        seed = int(hashlib.sha256(ticker.encode()).hexdigest()[:8], 16)
+        # One generator per field keeps each day's values independent of `end`.
+        rngs = [np.random.default_rng([seed, field]) for field in range(5)]
+        days = np.arange(self.origin.to_datetime64(), pd.Timestamp(end).to_datetime64(), dtype="datetime64[D]")
+        days = pd.DatetimeIndex(days[np.is_busday(days)], name="Date")
+        level, volatility = rngs[0].random(2)
+        close = 50 * (1 + level) * np.exp(np.cumsum(rngs[1].normal(0.0003, 0.01 + 0.015 * volatility, len(days))))
+        open_ = close * (1 + rngs[2].normal(0, 0.005, len(days)))
+        spread = np.abs(rngs[3].normal(0, 0.01, len(days))) * close
+        frame = pd.DataFrame(
+            {
+                "Open": open_,
+                "High": np.maximum(open_, close) + spread,
+                "Low": np.minimum(open_, close) - spread,
+                "Close": close,
+                "Volume": rngs[4].integers(100_000, 5_000_000, len(days)).astype(float),
+            },
+            index=days,
+        )
+        return frame.loc[pd.Timestamp(start):]
+
+
+DATA_SOURCES = {
+    "Yahoo Finance": YFinanceSource,
+    "Synthetic (offline)": SyntheticSource,
+}
+
+
+# -----------
+# OHLCV store
+# -----------
+def _merge_intervals(intervals):
+    """Merge overlapping or touching [start, end) intervals."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _business_days(start, end):
+    """Number of weekdays in [start, end), counting no further than today."""
+    end = min(pd.Timestamp(end), pd.Timestamp(date.today()))
+    if pd.Timestamp(start) >= end:
+        return 0
+    return int(np.busday_count(pd.Timestamp(start).date(), end.date()))
+
+
+def _missing_intervals(start, end, covered):
+    """Return the parts of [start, end) not covered by the merged `covered` intervals."""
+    gaps = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_end <= cursor:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class OHLCVStore:
+    """
+    Per-ticker Parquet bars on local disk plus the date intervals they cover.
+
+    Requests are answered by slicing the stored bars; only the parts of a
+    range that were never fetched need to go to the data source. Coverage
+    never extends past today, so the current (possibly incomplete) session
+    is always refreshed, and an empty answer for a range with weekdays in it
+    is not recorded as coverage, so a failed fetch is retried next time.
+    """
+
+    def __init__(self, store_dir=CACHE_DIR):
+        self.store_dir = store_dir
+        self._locks = {}
+        self._guard = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _paths(self, source_name, ticker):
+        safe = re.sub(r"[^A-Za-z0-9._-]", "_", ticker)
+        stem = os.path.join(self.store_dir, f"{source_name}-{safe}")
+        return f"{stem}.parquet", f"{stem}.json"
+
+    def _lock(self, source_name, ticker):
+        with self._guard:
+            return self._locks.setdefault((source_name, ticker), threading.Lock())
+
+    def coverage(self, source_name, ticker):
+        _, meta_path = self._paths(source_name, ticker)
+        if not os.path.exists(meta_path):
+            return []
+        with open(meta_path) as f:
+            return [(pd.Timestamp(a), pd.Timestamp(b)) for a, b in json.load(f)]
+
+    def gaps(self, source_name, ticker, start, end):
+        """Date ranges within [start, end) that have to be fetched."""
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        return _missing_intervals(start, end, self.coverage(source_name, ticker))
+
+    def read(self, source_name, ticker, start, end):
+        """Return the stored bars within [start, end)."""
+        data_path, _ = self._paths(source_name, ticker)
+        if not os.path.exists(data_path):
+            return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name="Date"))
+        frame = pd.read_parquet(data_path)
+        return frame.loc[pd.Timestamp(start):pd.Timestamp(end) - pd.Timedelta(microseconds=1)]
+
+    def write(self, source_name, ticker, start, end, frame):
+        """Merge freshly fetched bars for [start, end) into the store."""
+        data_path, meta_path = self._paths(source_name, ticker)
+        frame = frame.dropna(how="all")
+        if getattr(frame.index, "tz", None) is not None:
+            frame.index = frame.index.tz_localize(None)
+        frame.index = pd.DatetimeIndex(frame.index, name="Date")
+        covered_end = min(pd.Timestamp(end), pd.Timestamp(date.today()))
+        # An empty answer for a range with weekdays in it is more likely a failure than a holiday.
+        complete = not frame.empty or not _business_days(start, covered_end)
+
+        with self._lock(source_name, ticker):
+            if os.path.exists(data_path):
+                stored = pd.read_parquet(data_path)
+                frame = pd.concat([stored, frame]) if not frame.empty else stored
+                frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+            coverage = self.coverage(source_name, ticker)
+            if pd.Timestamp(start) < covered_end and complete:
+                coverage = _merge_intervals(coverage + [(pd.Timestamp(start), covered_end)])
+
+            frame.to_parquet(f"{data_path}.tmp")
+            os.replace(f"{data_path}.tmp", data_path)
+            with open(f"{meta_path}.tmp", "w") as f:
+                json.dump([(a.isoformat(), b.isoformat()) for a, b in coverage], f)
+            os.replace(f"{meta_path}.tmp", meta_path)
+
+
+# -------
+# Fetcher
+# -------
+def with_retries(func, retries=3, backoff=0.5):
+    """Call `func`, retrying with exponential backoff and jitter on any exception."""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt * (1 + random.random()))
+
+
+class MarketDataFetcher:
+    """Concurrent, gap-only price fetching on top of a data source and an OHLCV store."""
+
+    def __init__(self, source=None, store=None, max_workers=8, retries=3, backoff=0.5):
+        self.source = source or YFinanceSource()
+        self.source_name = type(self.source).__name__
+        self.store = store or OHLCVStore()
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+
+    def fetch(self, ticker, start, end):
+        """Return daily bars for one ticker."""
+        frames, failures = self.fetch_many([ticker], start, end)
+        if ticker in failures:
+            raise failures[ticker]
+        return frames[ticker]
+
+    def fetch_many(self, tickers, start, end):
+        """
+        Return ({ticker: frame}, {ticker: exception}) for `tickers`.
+
+        Only the gaps in each ticker's stored coverage are requested. Tickers
+        sharing the same gap are fetched in batches when the source supports
+        it, otherwise one request per (ticker, gap), all on a bounded thread
+        pool. Every window is then served by slicing the store. A ticker the
+        source returns nothing for, over more than `MAX_CLOSED_DAYS` weekdays,
+        counts as failed.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        by_gap = {}
+        for ticker in tickers:
+            for gap in self.store.gaps(self.source_name, ticker, start, end):
+                by_gap.setdefault(gap, []).append(ticker)
+
+        batch_size = getattr(self.source, "batch_size", None)
+        jobs = []
+        for (gap_start, gap_end), group in by_gap.items():
+            if batch_size and len(group) > 1:
+                jobs += [(group[i:i + batch_size], gap_start, gap_end) for i in range(0, len(group), batch_size)]
+            else:
+                jobs += [([ticker], gap_start, gap_end) for ticker in group]
+
+        def load(group, gap_start, gap_end):
+            if len(group) > 1:
+                return self.source.download(group, gap_start.date(), gap_end.date())
+            return {group[0]: self.source.history(group[0], gap_start.date(), gap_end.date())}
+
+        failures = {}
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+                futures = {
+                    pool.submit(with_retries, lambda job=job: load(*job), self.retries, self.backoff): job
+                    for job in jobs
+                }
+                for future in as_completed(futures):
+                    group, gap_start, gap_end = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        failures.update({t: error for t in group})
+                        continue
+                    for ticker in group:
+                        frame = result.get(ticker)
+                        if frame is None:
+                            frame = pd.DataFrame(columns=OHLCV_COLUMNS)
+                        if frame.dropna(how="all").empty and _business_days(gap_start, gap_end) > MAX_CLOSED_DAYS:
+                            failures[ticker] = LookupError(f"no data returned for {gap_start.date()} to {gap_end.date()}")
+                            continue
+                        self.store.write(self.source_name, ticker, gap_start, gap_end, frame)
+
+        frames = {
+            t: self.store.read(self.source_name, t, start, end) for t in tickers if t not in failures
+        }
+        return frames, failures
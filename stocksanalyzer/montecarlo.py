@@ -0,0 +1,193 @@
+"""
+Monte Carlo simulation of forward portfolio paths for the Stock Market Visualizer.
+
+Paths are generated in blocks of a few thousand with NumPy, either from a
+geometric Brownian motion fitted to the portfolio's daily log returns or
+by bootstrapping historical days. Each block is folded into per-step
+histograms and then discarded, so memory depends on the block size and not
+on the number of paths. Blocks are grouped into tasks that run on a
+process pool shared by all runs; every task gets its own seed spawned from one SeedSequence,
+so results are reproducible and do not depend on the number of workers.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+MODELS = {
+    "Geometric Brownian Motion": "gbm",
+    "Historical Bootstrap": "bootstrap",
+}
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+BLOCK_PATHS = 4_096
+TASK_PATHS = 65_536
+N_BINS = 2_048
+RANGE_SIGMAS = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    """The worker pool, created on first use and reused by later simulations."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers: forking the multi-threaded Streamlit server is unsafe.
+            _pool = ProcessPoolExecutor(os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def portfolio_log_returns(prices, weights):
+    """Daily log returns of a portfolio rebalanced to `weights` every day (price gaps forward-filled)."""
+    returns = prices.sort_index().ffill().pct_change(fill_method=None).iloc[1:]
+    simple = np.nan_to_num(returns.to_numpy(dtype=float)) @ np.asarray(weights, dtype=float)
+    return np.log1p(simple)
+
+
+class QuantileAccumulator:
+    """
+    Streaming per-step distribution of simulated log values.
+
+    Each step keeps a fixed histogram over mean +/- `RANGE_SIGMAS` standard
+    deviations of the log value (outliers land in the end bins), plus exact
+    sums for the mean. Accumulators from different workers merge by adding.
+    """
+
+    def __init__(self, horizon, drift, sigma, n_bins=N_BINS):
+        steps = np.arange(1, horizon + 1)
+        half_width = RANGE_SIGMAS * max(sigma, 1e-6) * np.sqrt(steps)
+        self.low = drift * steps - half_width
+        self.width = 2 * half_width / n_bins
+        self.n_bins = n_bins
+        self.counts = np.zeros((horizon, n_bins), dtype=np.int64)
+        self.value_sum = np.zeros(horizon)
+        self.n_paths = 0
+
+    def update(self, log_values):
+        """Add a (paths x steps) block of cumulative log returns."""
+        horizon = len(self.low)
+        bins = ((log_values - self.low) / self.width).astype(np.int64)
+        np.clip(bins, 0, self.n_bins - 1, out=bins)
+        bins += np.arange(horizon) * self.n_bins
+        self.counts += np.bincount(bins.ravel(), minlength=horizon * self.n_bins).reshape(horizon, self.n_bins)
+        self.value_sum += np.exp(log_values).sum(axis=0)
+        self.n_paths += len(log_values)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.value_sum += other.value_sum
+        self.n_paths += other.n_paths
+        return self
+
+    def quantiles(self, qs=DEFAULT_QUANTILES):
+        """Portfolio value quantiles per step, linearly interpolated within bins."""
+        cdf = np.cumsum(self.counts, axis=1) / self.n_paths
+        rows = np.arange(len(cdf))
+        out = {}
+        for q in qs:
+            idx = np.minimum((cdf < q).sum(axis=1), self.n_bins - 1)
+            below = np.where(idx > 0, cdf[rows, np.maximum(idx - 1, 0)], 0.0)
+            inside = self.counts[rows, idx] / self.n_paths
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fraction = np.clip(np.nan_to_num((q - below) / inside), 0.0, 1.0)
+            out[q] = np.exp(self.low + (idx + fraction) * self.width)
+        return out
+
+    def mean(self):
+        return self.value_sum / self.n_paths
+
+    def terminal_distribution(self):
+        """(bin centres as portfolio values, path counts) at the horizon."""
+        centers = np.exp(self.low[-1] + (np.arange(self.n_bins) + 0.5) * self.width[-1])
+        return centers, self.counts[-1]
+
+
+def _simulate_block(rng, model, n_paths, horizon, drift, sigma, history, block_length):
+    """Cumulative log returns for one (paths x steps) block."""
+    if model == "gbm":
+        steps = rng.normal(drift, sigma, (n_paths, horizon))
+    else:
+        # Moving-block bootstrap: consecutive historical days keep short-term autocorrelation.
+        n_blocks = -(-horizon // block_length)
+        starts = rng.integers(0, len(history), (n_paths, n_blocks))
+        offsets = np.arange(horizon)
+        steps = history[(starts[:, offsets // block_length] + offsets % block_length) % len(history)]
+    return np.cumsum(steps, axis=1, out=steps)
+
+
+def _run_task(seed, model, n_paths, horizon, drift, sigma, history, block_length, block_paths):
+    """Simulate `n_paths` paths block by block into a fresh accumulator."""
+    rng = np.random.default_rng(seed)
+    accumulator = QuantileAccumulator(horizon, drift, sigma)
+    for start in range(0, n_paths, block_paths):
+        size = min(block_paths, n_paths - start)
+        accumulator.update(_simulate_block(rng, model, size, horizon, drift, sigma, history, block_length))
+    return accumulator
+
+
+def simulate(
+    log_returns,
+    model="gbm",
+    n_paths=100_000,
+    horizon=252,
+    seed=0,
+    block_length=1,
+    workers=None,
+    block_paths=BLOCK_PATHS,
+    task_paths=TASK_PATHS,
+):
+    """
+    Simulate `n_paths` portfolio paths of `horizon` trading days.
+
+    `log_returns` are the portfolio's historical daily log returns; "gbm"
+    fits their mean and volatility, "bootstrap" resamples them in blocks
+    of `block_length` days. Returns a `QuantileAccumulator` over all paths
+    (portfolio value starts at 1).
+    """
+    history = np.asarray(log_returns, dtype=float)
+    history = history[np.isfinite(history)]
+    if len(history) < 2:
+        raise ValueError("At least two daily returns are needed to simulate.")
+    drift, sigma = history.mean(), history.std(ddof=1)
+
+    sizes = [min(task_paths, n_paths - start) for start in range(0, n_paths, task_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(s, model, size, horizon, drift, sigma, history, block_length, block_paths) for s, size in zip(seeds, sizes)]
+
+    workers = min(workers or os.cpu_count() or 1, len(args))
+    if workers <= 1:
+        results = [_run_task(*a) for a in args]
+    else:
+        results = _executor().map(_run_task, *zip(*args))
+    total = QuantileAccumulator(horizon, drift, sigma)
+    for result in results:
+        total.merge(result)
+    return total
+
+
+def fan_chart_frame(accumulator, index=None, qs=DEFAULT_QUANTILES):
+    """Per-step quantiles and mean as a frame (row 0 is today, value 1)."""
+    quantiles = accumulator.quantiles(qs)
+    frame = pd.DataFrame({f"P{round(q * 100)}": np.concatenate([[1.0], v]) for q, v in quantiles.items()}, index=index)
+    frame["Mean"] = np.concatenate([[1.0], accumulator.mean()])
+    return frame
+
+
+def terminal_risk(accumulator, confidence=0.95):
+    """Horizon statistics: median value, probability of loss, VaR and CVaR (as positive losses)."""
+    centers, counts = accumulator.terminal_distribution()
+    probability = counts / counts.sum()
+    var_value = accumulator.quantiles([1 - confidence])[1 - confidence][-1]
+    tail = centers <= var_value
+    tail_value = (centers[tail] * probability[tail]).sum() / probability[tail].sum() if tail.any() else var_value
+    return {
+        "Median Value": accumulator.quantiles([0.5])[0.5][-1],
+        "Expected Value": accumulator.mean()[-1],
+        "Probability of Loss": probability[centers < 1].sum(),
+        f"VaR ({confidence:.0%})": 1 - var_value,
+        f"CVaR ({confidence:.0%})": 1 - tail_value,
+    }
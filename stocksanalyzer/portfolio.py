@@ -0,0 +1,128 @@
+"""
+Portfolio backtests and risk metrics for the Stock Market Visualizer.
+
+Everything runs on a (dates x tickers) NumPy matrix. Between rebalances a
+portfolio is buy-and-hold, so its value is the weighted sum of each
+ticker's growth since the last rebalance; cumulative log returns turn that
+into a handful of array operations with no per-date Python loop.
+"""
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+REBALANCE_PERIODS = {
+    "Never (buy and hold)": None,
+    "Daily": "D",
+    "Weekly": "W",
+    "Monthly": "M",
+    "Quarterly": "Q",
+    "Yearly": "Y",
+}
+
+
+def normalize_weights(tickers, weights=None):
+    """Target weights summing to 1; equal weights when none are given."""
+    if weights is None:
+        return np.full(len(tickers), 1 / len(tickers))
+    weights = np.nan_to_num(np.asarray(weights, dtype=float))
+    total = weights.sum()
+    if total == 0:
+        return np.full(len(tickers), 1 / len(tickers))
+    return weights / total
+
+
+def rebalance_mask(index, period):
+    """True on the last trading day of each period (rebalance at that close)."""
+    mask = np.zeros(len(index), dtype=bool)
+    if period == "D":
+        mask[:] = True
+    elif period is not None:
+        labels = pd.DatetimeIndex(index).to_period(period).asi8
+        mask[:-1] = labels[1:] != labels[:-1]
+    mask[0] = True  # the portfolio is formed at the first close
+    return mask
+
+
+def backtest(prices, weights, period="M", cost_bps=0.0):
+    """
+    Simulate a portfolio rebalanced to `weights` every `period`.
+
+    `prices` is a (dates x tickers) frame. Gaps are forward-filled, so a
+    missing bar's move lands on the next observed day; leading missing
+    prices count as flat (a ticker that hasn't listed yet behaves like
+    cash). `cost_bps` is charged on traded notional at every rebalance.
+
+    Returns a dict with the daily `value` (starting at 1), daily `returns`,
+    `turnover` per rebalance date (one-way, as a fraction of the portfolio)
+    and the drifted `weights` held at the end.
+    """
+    index = prices.index
+    values = prices.ffill().to_numpy(dtype=float)
+    weights = np.asarray(weights, dtype=float)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_returns = np.log(values[1:] / values[:-1])
+    log_returns = np.nan_to_num(log_returns, nan=0.0, posinf=0.0, neginf=0.0)
+    cumulative = np.vstack([np.zeros(values.shape[1]), np.cumsum(log_returns, axis=0)])
+
+    mask = rebalance_mask(index, period)
+    anchors = np.flatnonzero(mask)
+    # Row t is held since the last rebalance strictly before t (row 0 anchors itself).
+    anchor_of = np.maximum(np.searchsorted(anchors, np.arange(len(index)), side="left") - 1, 0)
+
+    # Growth of each holding between consecutive rebalances, and the weights it drifted to.
+    growth = np.exp(cumulative[anchors[1:]] - cumulative[anchors[:-1]])
+    period_ratio = growth @ weights
+    drifted = growth * weights / period_ratio[:, None]
+    turnover = 0.5 * np.abs(drifted - weights).sum(axis=1)
+    cost = 1 - 2 * turnover * cost_bps / 10_000
+    anchor_value = np.concatenate([[1.0], np.cumprod(period_ratio * cost)])
+
+    since_anchor = np.exp(cumulative - cumulative[anchors[anchor_of]])
+    value = anchor_value[anchor_of] * (since_anchor @ weights)
+    value[anchors[1:]] *= cost  # costs are paid at the rebalancing close
+
+    final_growth = since_anchor[-1] * weights
+    return {
+        "value": pd.Series(value, index=index, name="Portfolio"),
+        "returns": pd.Series(np.concatenate([[0.0], value[1:] / value[:-1] - 1]), index=index, name="Portfolio"),
+        "turnover": pd.Series(turnover, index=index[anchors[1:]], name="Turnover"),
+        "weights": pd.Series(final_growth / final_growth.sum(), index=prices.columns, name="Weight"),
+    }
+
+
+def drawdowns(value):
+    """Drawdown from the running peak at each date."""
+    return value / np.maximum.accumulate(value.to_numpy()) - 1
+
+
+def risk_metrics(returns, risk_free=0.0, confidence=0.95, turnover=None):
+    """
+    Annualized performance and risk statistics for daily `returns`.
+
+    VaR and CVaR are historical one-day losses at `confidence`, reported
+    as positive fractions of portfolio value.
+    """
+    r = returns.to_numpy()[1:]
+    years = len(r) / TRADING_DAYS
+    growth = np.prod(1 + r)
+    excess = r - risk_free / TRADING_DAYS
+    volatility = r.std(ddof=1) * np.sqrt(TRADING_DAYS) if len(r) > 1 else np.nan
+    downside = np.sqrt(np.mean(np.minimum(excess, 0) ** 2)) * np.sqrt(TRADING_DAYS) if len(r) else np.nan
+    var = -np.quantile(r, 1 - confidence) if len(r) else np.nan
+    tail = r[r <= -var] if len(r) else r
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        metrics = {
+            "Total Return": growth - 1,
+            "CAGR": growth ** (1 / years) - 1 if years else np.nan,
+            "Volatility": volatility,
+            "Sharpe Ratio": excess.mean() * TRADING_DAYS / volatility if volatility else np.nan,
+            "Sortino Ratio": excess.mean() * TRADING_DAYS / downside if downside else np.nan,
+            "Max Drawdown": drawdowns((1 + returns).cumprod()).min(),
+            f"VaR ({confidence:.0%}, 1-day)": var,
+            f"CVaR ({confidence:.0%}, 1-day)": -tail.mean() if len(tail) else np.nan,
+        }
+    if turnover is not None:
+        metrics["Annual Turnover"] = turnover.sum() / years if years else np.nan
+    return metrics
@@ -0,0 +1,88 @@
+"""
+Chart payload reduction for the Stock Market Visualizer.
+
+OHLCV bars are aggregated to weekly, monthly, quarterly or yearly bars
+when the visible range holds more bars than the point budget, and line
+series are downsampled with Largest-Triangle-Three-Buckets (LTTB), which
+keeps the peaks and troughs that make a line chart look right.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_POINT_BUDGET = 2_000
+
+# (pandas rule, label, approximate calendar days per bar), finest first
+BAR_SIZES = [
+    ("W-FRI", "weekly", 7),
+    ("ME", "monthly", 30.4),
+    ("QE", "quarterly", 91.3),
+    ("YE", "yearly", 365.25),
+]
+OHLCV_AGGREGATION = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+
+def choose_bar_size(index, budget=DEFAULT_POINT_BUDGET):
+    """Return the finest (rule, label) that fits `budget` bars, or (None, "daily") if no resampling is needed."""
+    if len(index) <= budget:
+        return None, "daily"
+    span_days = (index[-1] - index[0]).days + 1
+    for rule, label, days in BAR_SIZES:
+        if span_days / days <= budget:
+            return rule, label
+    rule, label, _ = BAR_SIZES[-1]
+    return rule, label
+
+
+def resample_ohlcv(data, budget=DEFAULT_POINT_BUDGET):
+    """Aggregate OHLCV bars to fit `budget`; returns (bars, label)."""
+    rule, label = choose_bar_size(data.index, budget)
+    if rule is None:
+        return data, label
+    columns = {c: how for c, how in OHLCV_AGGREGATION.items() if c in data.columns}
+    bars = data[list(columns)].resample(rule).agg(columns)
+    return bars.dropna(subset=["Close"] if "Close" in columns else None), label
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previous
+    kept point and the average of the next bucket. NaNs are dropped first.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    n = valid.size
+    if threshold >= n or threshold < 3:
+        return valid
+    x, y = x[valid], y[valid]
+
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for b in range(threshold - 2):
+        start, stop = edges[b], edges[b + 1]
+        if b + 2 < len(edges):
+            next_start, next_stop = edges[b + 1], edges[b + 2]
+        else:
+            next_start, next_stop = n - 1, n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[b + 1] = previous
+    return valid[kept]
+
+
+def downsample_series(series, budget=DEFAULT_POINT_BUDGET):
+    """Return `series` reduced to at most `budget` points with LTTB."""
+    if len(series) <= budget:
+        return series
+    x = series.index.asi8 if isinstance(series.index, pd.DatetimeIndex) else np.arange(len(series))
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=float), budget)]